@@ -0,0 +1,168 @@
+################################################################################
+# animator.py                                                                  #
+# Live view of the BATMAN Simulator. Draws the user nodes on the GUI canvas    #
+# and animates OGM and data packet hops as the controller advances. Redraws    #
+# are throttled to a minimum interval, and a frame that costs more than the    #
+# frame budget pushes the view into per-edge aggregation and stretches the     #
+# interval so drawing never takes more than its share of the simulation time.  #
+################################################################################
+
+import math
+import time
+
+import ogm
+import registry
+
+
+class Animator:
+    # Constructor
+    def __init__(self, canvas, controller, interval=0.05, frameBudget=0.01, aggregateLimit=40):
+        self.canvas = canvas
+        self.controller = controller
+
+        # Minimum wall-clock seconds between redraws and the most a single frame may cost
+        self.baseInterval = interval
+        self.interval = interval
+        self.frameBudget = frameBudget
+
+        # Networks (or steps) larger than this are drawn as aggregated per-edge traffic
+        self.aggregateLimit = aggregateLimit
+        self.aggregate = False
+
+        # Node positions convention: <key>ID : <value> (x, y) canvas coordinates
+        self.positions = {}
+
+        # Edge traffic since the last frame convention: <key>(source ID, next hop ID) : <value> [OGMs, data]
+        self.edgeTraffic = {}
+        self.pendingHops = []
+
+        self.lastFrame = 0.0
+        self.colors = ("#0e1927", "white", "#ffd11a", "#00802b", "#3a4a5e")
+
+    # Controller listener: collect the hops of this step and draw if the throttle allows it
+    def update(self, clock, hops):
+        for source, nextHop, packet in hops:
+            key = (source, nextHop)
+            if key not in self.edgeTraffic:
+                self.edgeTraffic[key] = [0, 0]
+
+            if packet.payload != "":
+                self.edgeTraffic[key][1] += 1
+            elif isinstance(packet, ogm.Frame):
+                self.edgeTraffic[key][0] += len(packet.packets)
+            else:
+                self.edgeTraffic[key][0] += 1
+
+        # Individual hops are only kept while the view still animates packets
+        if not self.aggregate:
+            self.pendingHops.extend(hops)
+            if len(self.pendingHops) > self.aggregateLimit:
+                self.pendingHops = self.pendingHops[-self.aggregateLimit:]
+
+        if time.time() - self.lastFrame >= self.interval:
+            self.draw(clock)
+
+    # Draw one frame of the network and the traffic collected since the last frame
+    def draw(self, clock=None):
+        start = time.time()
+
+        if clock is None:
+            clock = self.controller.clock
+
+        self.layout()
+        self.canvas.delete("all")
+
+        aggregate = self.aggregate or len(self.positions) > self.aggregateLimit
+        if aggregate:
+            self.drawAggregate()
+        else:
+            self.drawPackets()
+
+        self.drawNodes(not aggregate)
+        self.canvas.create_text(5, 5, anchor="nw", fill=self.colors[1], text="Time: " + str(clock))
+        self.canvas.update_idletasks()
+
+        self.edgeTraffic = {}
+        self.pendingHops = []
+
+        # Keep drawing within the frame budget: fall back to aggregation and stretch the interval
+        cost = time.time() - start
+        if cost > self.frameBudget:
+            self.aggregate = True
+            self.interval = max(self.baseInterval, self.interval * cost / self.frameBudget)
+
+        self.lastFrame = time.time()
+
+    # Place the nodes on a circle, recomputed only when the set of nodes changes
+    def layout(self):
+        if len(self.positions) == len(self.controller.network):
+            found = True
+            for nodeID in self.controller.network:
+                if nodeID not in self.positions:
+                    found = False
+                    break
+            if found:
+                return
+
+        width = int(self.canvas.cget("width"))
+        height = int(self.canvas.cget("height"))
+        radius = min(width, height) / 2.0 - 20
+        ids = self.controller.network.keys()
+
+        self.positions = {}
+        for index, nodeID in enumerate(ids):
+            angle = 2.0 * math.pi * index / max(len(ids), 1)
+            self.positions[nodeID] = (width / 2.0 + radius * math.cos(angle), height / 2.0 + radius * math.sin(angle))
+
+    # Draw each node, with its IP label on small networks
+    def drawNodes(self, labels):
+        size = 6 if labels else 2
+        for nodeID, (x, y) in self.positions.iteritems():
+            self.canvas.create_oval(x - size, y - size, x + size, y + size, fill=self.colors[1], outline="")
+            if labels:
+                self.canvas.create_text(x, y - 12, fill=self.colors[1], text=registry.ip(nodeID))
+
+    # Draw the neighbor links and a dot on the link for every hop since the last frame
+    def drawPackets(self):
+        for nodeID, node in self.controller.network.iteritems():
+            if nodeID not in self.positions:
+                continue
+            for neighbor in node.neighbors:
+                if neighbor.ID in self.positions:
+                    x1, y1 = self.positions[nodeID]
+                    x2, y2 = self.positions[neighbor.ID]
+                    self.canvas.create_line(x1, y1, x2, y2, fill=self.colors[4])
+
+        for source, nextHop, packet in self.pendingHops:
+            if source not in self.positions or nextHop not in self.positions:
+                continue
+
+            # The dot sits two thirds of the way toward the receiver
+            x1, y1 = self.positions[source]
+            x2, y2 = self.positions[nextHop]
+            x = x1 + (x2 - x1) * 2.0 / 3.0
+            y = y1 + (y2 - y1) * 2.0 / 3.0
+
+            color = self.colors[3] if packet.payload != "" else self.colors[2]
+            self.canvas.create_oval(x - 3, y - 3, x + 3, y + 3, fill=color, outline="")
+
+    # Draw only the links that carried traffic, thicker for busier links
+    def drawAggregate(self):
+        for (source, nextHop), (ogms, data) in self.edgeTraffic.iteritems():
+            if source not in self.positions or nextHop not in self.positions:
+                continue
+
+            x1, y1 = self.positions[source]
+            x2, y2 = self.positions[nextHop]
+            color = self.colors[3] if data > 0 else self.colors[2]
+            width = min(1 + int(math.log(ogms + data, 2)), 6)
+            self.canvas.create_line(x1, y1, x2, y2, fill=color, width=width)
+
+    # Forget the layout and any collected traffic (used when the network is cleared)
+    def reset(self):
+        self.positions = {}
+        self.edgeTraffic = {}
+        self.pendingHops = []
+        self.aggregate = False
+        self.interval = self.baseInterval
+        self.canvas.delete("all")
@@ -13,10 +13,18 @@
 
 
 from Tkinter import *
+import tkFileDialog
+import shutil
 import time
+import animator
 import controller
+import nodetable
 import ogm
+import scenario
+import topology
 import user
+import warmstart
+import wire
 
 
 class ApplicationUI:
@@ -33,8 +41,8 @@ class ApplicationUI:
         # Text field width and height
         console_width = 80
         console_height = 20
-        canvas_width = 200
-        canvas_height = 200
+        canvas_width = 900
+        canvas_height = 250
 
         # Button sizes
         entry_width = 20
@@ -69,10 +77,24 @@ class ApplicationUI:
         self.spoofAttacker_str = StringVar()
         self.spoofVictim_str = StringVar()
         self.timeStep_int = IntVar()
+        self.changesOnly_int = IntVar()
 
-        # Piped messages for display
+        # Piped messages for display (pending until the next console flush)
         self.messagePipe = ["Console Log:\n", ]
 
+        # Console scrollback is capped at a number of lines; the full history is spilled to an on-disk log
+        self.consoleLimit = 2000
+        self.consoleLogName = "consoleLog_" + time.strftime("%d%m%Y%H%M%S")
+        self.consoleLog = open(self.consoleLogName, "w")
+        self.consoleLogMark = 0
+
+        # Packet capture of the running simulation (None when not capturing)
+        self.capture = None
+
+        # Topology import running in slices between GUI events (None when not importing)
+        self.importer = None
+        self.importSlice = 2000
+
         # Create and store the frame handles
         self.left_frame = Frame(width=550, height=75, borderwidth=5)
         self.left_frame.grid(row=0, column=0)
@@ -86,11 +108,17 @@ class ApplicationUI:
         self.file_menu = Menu(self.menu)
         self.help_menu = Menu(self.menu)
         self.window.config(menu=self.menu)
+        self.window.protocol("WM_DELETE_WINDOW", self.exitApplication)
         self.menu.add_cascade(label="File", menu=self.file_menu)
         self.file_menu.add_command(label="New", command=self.clearNetwork)
         self.file_menu.add_command(label="Save", command=self.saveNetwork)
+        self.file_menu.add_command(label="Warm Start", command=self.warmStart)
+        self.file_menu.add_command(label="Load Scenario", command=self.loadScenario)
+        self.file_menu.add_command(label="Import Topology", command=self.importTopology)
+        self.file_menu.add_command(label="Export Topology", command=self.exportTopology)
+        self.file_menu.add_command(label="Start/Stop Capture", command=self.toggleCapture)
         self.file_menu.add_separator()
-        self.file_menu.add_command(label="Exit", command=self.window.quit)
+        self.file_menu.add_command(label="Exit", command=self.exitApplication)
         self.menu.add_cascade(label="Help", menu=self.help_menu)
         self.help_menu.add_command(label="User Manual", command=self.showManual)
 
@@ -98,9 +126,13 @@ class ApplicationUI:
         self.console = Text(self.right_frame, width=console_width, height=console_height,
                             background=self.colors[6], foreground=self.colors[0])
         self.console_scrollbar = Scrollbar(self.right_frame, command=self.console.yview)
-        self.canvas = Canvas(self.foot_frame, width=canvas_width, height=canvas_height)
+        self.canvas = Canvas(self.foot_frame, width=canvas_width, height=canvas_height, background=self.colors[6])
+        self.animator = animator.Animator(self.canvas, self.controller)
+        self.controller.addListener(self.animator.update, observer=True)
         self.print_button = Button(self.right_frame, text="Report Console", width=entry_width, command=self.printConsole)
         self.graph_button = Button(self.right_frame, text="Graph", width=entry_width, command=self.drawNetwork)
+        self.changesOnly_check = Checkbutton(self.right_frame, text="Changes Only", variable=self.changesOnly_int)
+        self.nodeTable = nodetable.NodeTable(self.right_frame, self.controller, onSelect=self.editNode)
 
         # Create the node button widgets
         self.node1_button = Button(self.left_frame, text="User Node 1", width=button_width, command=self.displayUserInput1)
@@ -198,9 +230,15 @@ class ApplicationUI:
         self.console_scrollbar.grid(row=0, column=1, sticky=N+S)
         self.console_scrollbar.config(command=self.console.yview)
         self.console.config(yscrollcommand=self.console_scrollbar.set)
-        self.console.insert(END, self.messagePipe[0])
+        self.flushConsole()
         self.print_button.grid(row=1, column=0, columnspan=2)
         self.graph_button.grid(row=2, column=0, columnspan=2)
+        self.changesOnly_check.grid(row=3, column=0, columnspan=2)
+        self.nodeTable.grid(row=4, column=0, columnspan=2)
+        self.nodeTable.refresh()
+
+        # Live network view
+        self.canvas.grid(row=0, column=0)
 
         # Node Buttons (Initial state)
         self.node1_button.grid(row=0, column=0, columnspan=2)
@@ -219,174 +257,202 @@ class ApplicationUI:
     # Add a constructed user node to the system
     def addUser1(self):
         newUser = user.User(ip=self.ip1_entry.get(), castTime=self.castTime1_int.get())
-        newUser.neighbors = self.neighbors1_list
+        for neighbor in self.neighbors1_list:
+            newUser.addNeighbor(neighbor)
         if self.controller.addUser(newUser):
             self.neighbors_list.append(newUser.IP)
+            self.nodeTable.refresh()
 
     def addUser2(self):
         newUser = user.User(ip=self.ip2_entry.get(), castTime=self.castTime2_int.get())
-        newUser.neighbors = self.neighbors2_list
+        for neighbor in self.neighbors2_list:
+            newUser.addNeighbor(neighbor)
         if self.controller.addUser(newUser):
             self.neighbors_list.append(newUser.IP)
+            self.nodeTable.refresh()
 
     def addUser3(self):
         newUser = user.User(ip=self.ip3_entry.get(), castTime=self.castTime3_int.get())
-        newUser.neighbors = self.neighbors3_list
+        for neighbor in self.neighbors3_list:
+            newUser.addNeighbor(neighbor)
         if self.controller.addUser(newUser):
             self.neighbors_list.append(newUser.IP)
+            self.nodeTable.refresh()
 
     def addUser4(self):
         newUser = user.User(ip=self.ip4_entry.get(), castTime=self.castTime4_int.get())
-        newUser.neighbors = self.neighbors4_list
+        for neighbor in self.neighbors4_list:
+            newUser.addNeighbor(neighbor)
         if self.controller.addUser(newUser):
             self.neighbors_list.append(newUser.IP)
+            self.nodeTable.refresh()
 
     # Remove a user node from the system
     def removeUser1(self):
-        exitUser = self.controller.network[self.ip1_entry.get()]
+        exitUser = self.controller.findUser(self.ip1_entry.get())
         self.controller.removeUser(exitUser)
+        self.nodeTable.refresh()
         print str(self.neighbors_list)  # STUB : Debug console
 
     def removeUser2(self):
-        exitUser = self.controller.network[self.ip2_entry.get()]
+        exitUser = self.controller.findUser(self.ip2_entry.get())
         self.controller.removeUser(exitUser)
+        self.nodeTable.refresh()
         print str(self.neighbors_list)  # STUB : Debug console
 
     def removeUser3(self):
-        exitUser = self.controller.network[self.ip3_entry.get()]
+        exitUser = self.controller.findUser(self.ip3_entry.get())
         self.controller.removeUser(exitUser)
+        self.nodeTable.refresh()
         print str(self.neighbors_list)  # STUB : Debug console
 
     def removeUser4(self):
-        exitUser = self.controller.network[self.ip4_entry.get()]
+        exitUser = self.controller.findUser(self.ip4_entry.get())
         self.controller.removeUser(exitUser)
+        self.nodeTable.refresh()
         print str(self.neighbors_list)  # STUB : Debug console
 
     # Add a neighbor from a drop down listing
     def addNeighbor1(self):
-        if self.neighbor1_str.get() in self.controller.network.keys():
-            if self.ip1_entry.get() in self.controller.network.keys():
-                notFound = True
-                for each in self.controller.network[self.ip1_entry.get()].neighbors:
-                    if self.neighbor1_str.get() == each.IP:
-                        notFound = False
-                if notFound:
-                    self.controller.network[self.ip1_entry.get()].neighbors.append(self.controller.network[self.neighbor1_str.get()])
+        if self.controller.findUser(self.neighbor1_str.get()) is not None:
+            if self.controller.findUser(self.ip1_entry.get()) is not None:
+                self.controller.findUser(self.ip1_entry.get()).addNeighbor(self.controller.findUser(self.neighbor1_str.get()))
             else:
-                self.neighbors1_list.append(self.controller.network[self.neighbor1_str.get()])
+                self.neighbors1_list.append(self.controller.findUser(self.neighbor1_str.get()))
 
     def addNeighbor2(self):
-        if self.neighbor2_str.get() in self.controller.network.keys():
-            if self.ip2_entry.get() in self.controller.network.keys():
-                notFound = True
-                for each in self.controller.network[self.ip2_entry.get()].neighbors:
-                    if self.neighbor2_str.get() == each.IP:
-                        notFound = False
-                if notFound:
-                    self.controller.network[self.ip2_entry.get()].neighbors.append(self.controller.network[self.neighbor2_str.get()])
+        if self.controller.findUser(self.neighbor2_str.get()) is not None:
+            if self.controller.findUser(self.ip2_entry.get()) is not None:
+                self.controller.findUser(self.ip2_entry.get()).addNeighbor(self.controller.findUser(self.neighbor2_str.get()))
             else:
-                self.neighbors2_list.append(self.controller.network[self.neighbor2_str.get()])
+                self.neighbors2_list.append(self.controller.findUser(self.neighbor2_str.get()))
 
     def addNeighbor3(self):
-        if self.neighbor3_str.get() in self.controller.network.keys():
-            if self.ip3_entry.get() in self.controller.network.keys():
-                notFound = True
-                for each in self.controller.network[self.ip3_entry.get()].neighbors:
-                    if self.neighbor3_str.get() == each.IP:
-                        notFound = False
-                if notFound:
-                    self.controller.network[self.ip3_entry.get()].neighbors.append(self.controller.network[self.neighbor3_str.get()])
+        if self.controller.findUser(self.neighbor3_str.get()) is not None:
+            if self.controller.findUser(self.ip3_entry.get()) is not None:
+                self.controller.findUser(self.ip3_entry.get()).addNeighbor(self.controller.findUser(self.neighbor3_str.get()))
             else:
-                self.neighbors3_list.append(self.controller.network[self.neighbor3_str.get()])
+                self.neighbors3_list.append(self.controller.findUser(self.neighbor3_str.get()))
 
     def addNeighbor4(self):
-        if self.neighbor4_str.get() in self.controller.network.keys():
-            if self.ip4_entry.get() in self.controller.network.keys():
-                notFound = True
-                for each in self.controller.network[self.ip4_entry.get()].neighbors:
-                    if self.neighbor4_str.get() == each.IP:
-                        notFound = False
-                if notFound:
-                    self.controller.network[self.ip4_entry.get()].neighbors.append(self.controller.network[self.neighbor4_str.get()])
+        if self.controller.findUser(self.neighbor4_str.get()) is not None:
+            if self.controller.findUser(self.ip4_entry.get()) is not None:
+                self.controller.findUser(self.ip4_entry.get()).addNeighbor(self.controller.findUser(self.neighbor4_str.get()))
             else:
-                self.neighbors4_list.append(self.controller.network[self.neighbor4_str.get()])
+                self.neighbors4_list.append(self.controller.findUser(self.neighbor4_str.get()))
 
     # Remove a neighbor from the node
     def removeNeighbor1(self):
-        if self.ip1_entry.get() in self.controller.network.keys():
-            if self.neighbor1_str.get() in self.controller.network.keys():
-                userNode = self.controller.network[self.ip1_entry.get()]
-                neighbor = self.controller.network[self.neighbor1_str.get()]
+        if self.controller.findUser(self.ip1_entry.get()) is not None:
+            if self.controller.findUser(self.neighbor1_str.get()) is not None:
+                userNode = self.controller.findUser(self.ip1_entry.get())
+                neighbor = self.controller.findUser(self.neighbor1_str.get())
                 userNode.removeNeighbor(neighbor)
 
     def removeNeighbor2(self):
-        if self.ip2_entry.get() in self.controller.network.keys():
-            if self.neighbor2_str.get() in self.controller.network.keys():
-                userNode = self.controller.network[self.ip2_entry.get()]
-                neighbor = self.controller.network[self.neighbor2_str.get()]
+        if self.controller.findUser(self.ip2_entry.get()) is not None:
+            if self.controller.findUser(self.neighbor2_str.get()) is not None:
+                userNode = self.controller.findUser(self.ip2_entry.get())
+                neighbor = self.controller.findUser(self.neighbor2_str.get())
                 userNode.removeNeighbor(neighbor)
 
     def removeNeighbor3(self):
-        if self.ip3_entry.get() in self.controller.network.keys():
-            if self.neighbor3_str.get() in self.controller.network.keys():
-                userNode = self.controller.network[self.ip3_entry.get()]
-                neighbor = self.controller.network[self.neighbor3_str.get()]
+        if self.controller.findUser(self.ip3_entry.get()) is not None:
+            if self.controller.findUser(self.neighbor3_str.get()) is not None:
+                userNode = self.controller.findUser(self.ip3_entry.get())
+                neighbor = self.controller.findUser(self.neighbor3_str.get())
                 userNode.removeNeighbor(neighbor)
 
     def removeNeighbor4(self):
-        if self.ip4_entry.get() in self.controller.network.keys():
-            if self.neighbor4_str.get() in self.controller.network.keys():
-                userNode = self.controller.network[self.ip4_entry.get()]
-                neighbor = self.controller.network[self.neighbor4_str.get()]
+        if self.controller.findUser(self.ip4_entry.get()) is not None:
+            if self.controller.findUser(self.neighbor4_str.get()) is not None:
+                userNode = self.controller.findUser(self.ip4_entry.get())
+                neighbor = self.controller.findUser(self.neighbor4_str.get())
                 userNode.removeNeighbor(neighbor)
 
     # Create attacker node by collecting spoof data
     # Attacker must be valid IP in the network, but spoofed IP can be anything
     def addSpoof(self):
-        if self.spoofAttacker_str.get() in self.controller.network.keys():
-            userNode = self.controller.network[self.spoofAttacker_str.get()]
-            userNode.spoof = True
-            userNode.spoofIP = self.spoofVictim_str.get()
+        if self.controller.findUser(self.spoofAttacker_str.get()) is not None:
+            userNode = self.controller.findUser(self.spoofAttacker_str.get())
+            userNode.spoofAs(self.spoofVictim_str.get())
 
     # Create and send a message (wrapped in OGM class)
     def sendMessage(self):
         # Check for the source IP in the network and create the message with the sender's information
-        if self.msgSender_str.get() in self.controller.network.keys():
-            sender = self.controller.network[self.msgSender_str.get()]
+        if self.controller.findUser(self.msgSender_str.get()) is not None:
+            sender = self.controller.findUser(self.msgSender_str.get())
             sender.sendMessage(destination=self.msgRcvr_str.get(), ttl=self.msgTTL_int.get(), data=self.msgMessage_str.get())
 
     # Clear the network and restart
     def clearNetwork(self):
         self.controller.clear()
+        self.animator.reset()
+        self.nodeTable.refresh()
+
+    # Spill the pending console text to the log, close the log and any running capture, and leave the main loop
+    def exitApplication(self):
+        if not self.consoleLog.closed:
+            self.consoleLog.write("".join(self.messagePipe))
+            self.messagePipe = []
+            self.consoleLog.close()
+
+        if self.capture is not None:
+            self.controller.removeListener(self.capture.update)
+            self.capture.close()
+            self.capture = None
+
+        self.window.quit()
 
     # Print a report of the console log to a file titled with today's data and time
+    # Only the history logged since the previous report is written
     def printConsole(self):
+        self.flushConsole()
+
         fileOUT = open("report" + "_" + time.strftime("%d%m%Y%H%M"), "w")
-        for line in self.messagePipe:
-            if not isinstance(line, basestring):
-                outLine = ", ".join(line)
-                fileOUT.write(outLine)
-            else:
-                fileOUT.write(line)
-            fileOUT.write("\n")
+        logIN = open(self.consoleLogName, "r")
+        logIN.seek(self.consoleLogMark)
+        shutil.copyfileobj(logIN, fileOUT)
+        self.consoleLogMark = logIN.tell()
+        logIN.close()
         fileOUT.close()
 
-        # Clear the message pipeline
+    # Queue text for the console, nothing is drawn until the next flush
+    def writeConsole(self, text):
+        self.messagePipe.append(text)
+
+    # Render all pending console text in one insert, spill it to the log, and trim the oldest scrollback
+    def flushConsole(self):
+        if len(self.messagePipe) == 0:
+            return
+
+        text = "".join(self.messagePipe)
         self.messagePipe = []
 
+        if not self.consoleLog.closed:
+            self.consoleLog.write(text)
+            self.consoleLog.flush()
+
+        self.console.insert(END, text)
+        lines = int(self.console.index("end-1c").split(".")[0])
+        if lines > self.consoleLimit:
+            self.console.delete("1.0", str(lines - self.consoleLimit + 1) + ".0")
+        self.console.yview(END)
+
     # Show the network state in the console
     def reportConsole(self):
-        self.messagePipe.append(self.controller.reportString())
-        self.console.insert(END, self.messagePipe[-1])
-        self.messagePipe.append("\n\n")
-        self.console.insert(END, self.messagePipe[-1])
-        self.console.yview(END)
+        self.nodeTable.refresh()
+        self.writeConsole(self.controller.reportString())
+        self.writeConsole("\n\n")
+
+        # Report only the nodes that changed since the last report, or each node status (cached until it changes)
+        if self.changesOnly_int.get():
+            self.writeConsole(self.controller.reportDeltaString())
+        else:
+            for node in self.controller.network.itervalues():
+                self.writeConsole(node.reportString())
 
-        # Report each node status
-        for node in self.controller.network:
-            self.messagePipe.append(self.controller.network[node].reportString())
-            self.console.insert(END, self.messagePipe[-1])
-            self.console.yview(END)
+        self.flushConsole()
 
     # Save the current network data to a file
     def saveNetwork(self):
@@ -424,6 +490,107 @@ class ApplicationUI:
         # Close the file
         fileOUT.close()
 
+    # Jump the network straight to its converged routing state
+    def warmStart(self):
+        warmstart.warmStart(self.controller)
+        self.writeConsole("\n\nWarm Start: converged routing computed from the topology\n\n")
+        self.animator.draw()
+        self.reportConsole()
+
+    # Load a scenario file whose events are applied as the simulation runs
+    def loadScenario(self):
+        fileName = tkFileDialog.askopenfilename(title="Load Scenario")
+        if not fileName:
+            return
+
+        try:
+            loaded = scenario.load(fileName)
+        except (IOError, ValueError) as error:
+            self.writeConsole("\n\nScenario not loaded: " + str(error) + "\n\n")
+        else:
+            self.controller.loadScenario(loaded)
+            self.writeConsole("\n\nScenario loaded: " + str(len(loaded)) + " events from " + fileName + "\n\n")
+
+        self.flushConsole()
+
+    # Import a topology file (edge list, CSV, or GraphML) a slice of records at a time
+    def importTopology(self):
+        if self.importer is not None:
+            return
+
+        fileName = tkFileDialog.askopenfilename(title="Import Topology")
+        if not fileName:
+            return
+
+        try:
+            self.importer = topology.Importer(self.controller, fileName, castTime=self.castTime1_int.get())
+        except (IOError, ValueError) as error:
+            self.writeConsole("\n\nTopology not imported: " + str(error) + "\n\n")
+            self.flushConsole()
+            return
+
+        self.window.after(0, self.importSlices)
+
+    # Apply one slice of the import and yield to the GUI before the next
+    def importSlices(self):
+        try:
+            more = self.importer.step(self.importSlice)
+        except ValueError as error:
+            self.writeConsole("\n\n" + self.importer.reportString() + "Topology import stopped: " + str(error) + "\n\n")
+            more = False
+        else:
+            if not more:
+                self.writeConsole("\n\n" + self.importer.reportString() + "\n")
+
+        self.nodeTable.refresh()
+        if more:
+            self.window.after(1, self.importSlices)
+        else:
+            self.importer = None
+            self.animator.draw()
+            self.flushConsole()
+
+    # Export the network topology, the format chosen by the file extension
+    def exportTopology(self):
+        fileName = tkFileDialog.asksaveasfilename(title="Export Topology", defaultextension=".graphml",
+                                                  filetypes=[("GraphML", "*.graphml"), ("CSV", "*.csv"),
+                                                             ("Edge List", "*.txt")])
+        if not fileName:
+            return
+
+        try:
+            topology.save(self.controller, fileName)
+        except (IOError, ValueError) as error:
+            self.writeConsole("\n\nTopology not exported: " + str(error) + "\n\n")
+        else:
+            self.writeConsole("\n\nTopology exported: " + str(len(self.controller.network)) + " nodes to " +
+                              fileName + "\n\n")
+
+        self.flushConsole()
+
+    # Load a node picked in the node table into the node editor
+    def editNode(self, node):
+        self.displayUserInput1()
+        self.ip1_entry.delete(0, END)
+        self.ip1_entry.insert(0, node.IP)
+        self.castTime1_int.set(node.broadcastTime)
+        self.neighbor1_str.set(node.neighbors[0].IP if len(node.neighbors) > 0 else "")
+
+    # Start streaming the simulated packets to a pcap file, or stop and close the current capture
+    def toggleCapture(self):
+        if self.capture is None:
+            self.capture = wire.PcapWriter("capture_" + time.strftime("%d%m%Y%H%M%S") + ".pcap")
+            self.controller.addListener(self.capture.update, observer=True)
+            self.writeConsole("\n\nCapture started: " + self.capture.fileName + "\n\n")
+        else:
+            self.controller.removeListener(self.capture.update)
+            self.capture.close()
+            self.writeConsole("\n\nCapture stopped: " + str(self.capture.packets) + " packets written to " +
+                              self.capture.fileName + "\n\n")
+            self.capture = None
+
+        self.flushConsole()
+
     # Draw the network in a canvas
     def drawNetwork(self):
         self.controller.reportGraph()
@@ -431,9 +598,14 @@ class ApplicationUI:
     # Run the program for the specified time
     def runNetwork(self):
         if self.timeStep_int.get() > 0:
-            self.messagePipe.append("\n\nRun Time: " + str(self.timeStep_int.get()) + "\n\n")
-            self.console.insert(END, self.messagePipe[-1])
+            self.writeConsole("\n\nRun Time: " + str(self.timeStep_int.get()) + "\n\n")
+            start = self.controller.clock
             self.controller.tick(self.timeStep_int.get())
+
+            # Show the spoof alerts raised during the run ahead of the report
+            if len(self.controller.detector.alertsSince(start)) > 0:
+                self.writeConsole(self.controller.detector.reportString(since=start) + "\n")
+            self.animator.draw()
             self.reportConsole()
 
     # User node drop down function displays
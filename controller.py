@@ -10,63 +10,557 @@
 
 import networkx as netx
 import matplotlib.pyplot as plot
+import collections
+import copy
+import cPickle as pickle
+import gc
+import multiprocessing
+import os
+import random
+import select
 import time
+import traceback
 
+import detector
+import histogram
+import link
+import memory
 import ogm
+import registry
+import scenario
+import timeline
 import user
 
 
+# Lost packets kept for the report (every loss is still counted)
+LOST_HISTORY = 10000
+
+
 class Controller:
     # Constructor
     def __init__(self):
-        # Network will be a dictionary referenced by IP addresses
-        self.network = {}
-        self.lostOGMs = []
+        # Network will be a dictionary referenced by node IDs (see registry.py), kept in the order nodes joined
+        # IDs depend on what else the process interned, so join order is what keeps a run repeatable
+        # Join order convention: <key>node ID : <value> rank among the nodes that joined this simulation
+        self.network = collections.OrderedDict()
+        self.joinOrder = {}
+        self.joins = 0
+
+        # The latest lost packets, with the total lost over the run
+        self.lostOGMs = collections.deque(maxlen=LOST_HISTORY)
+        self.lostCount = 0
+        self.lostHeld = memory.newHeld()
+
+        # Simulation clock (total time steps run) and listeners called after each step
+        # Listener convention: function(clock, hops) with hops as (source ID, next hop ID, OGM or Frame) tuples
+        # Observers are the listeners that only watch the simulation (the GUI animator, a capture file)
+        self.clock = 0
+        self.listeners = []
+        self.observers = []
+
+        # Delivery latency and hop count histograms shared with every user node
+        self.deliveryStats = histogram.DeliveryStats()
+
+        # Next hop changes of every node toward every originator, indexed by time step
+        self.timeline = timeline.RouteTimeline()
+
+        # IDs of the nodes with changes not yet given in a delta report
+        self.changedNodes = set()
+
+        # Memory account sampling this simulation (None when not accounting)
+        self.memory = None
+
+        # Originator IDs tracked in sampled mode (None tracks every originator)
+        self.tracked = None
+
+        # Inline spoof checks on every OGM received
+        self.detector = detector.SpoofDetector()
+
+        # Links convention: <key>(source ID, destination ID) : <value> Link instance
+        # Links are created on first use with the default capacity unless one was set for the pair
+        # Node links convention (reverse index): <key>node ID : <value> set of link keys it is an end of
+        self.links = {}
+        self.nodeLinks = {}
+        self.activeLinks = set()
+        self.linkCapacity = 1
+        self.capacities = {}
+
+        # Packets each node processes from its receive queue per time step (None for all delivered)
+        self.receiveRate = None
+
+        # Bundle the OGMs a node has for the same next hop in a time step into one frame
+        self.aggregate = True
+        self.framesSent = 0
+        self.ogmsAggregated = 0
+
+        # Scenario events applied at the start of the steps they fall due (None for no scenario)
+        self.scenario = None
 
     # Add users to the network based on given user node
     def addUser(self, newUser):
         # Check that the user is unique
-        if newUser.IP in self.network.keys():
+        if newUser.ID in self.network:
             return False
         else:
-            self.network[newUser.IP] = newUser
-            self.updateNetwork()
+            self.network[newUser.ID] = newUser
+            self.joinOrder[newUser.ID] = self.joins
+            self.joins += 1
+            newUser.indexNeighbors()
+            self.attach(newUser)
+
+            self.changedNodes.add(newUser.ID)
             return True
 
-    # Remove user from the network
+    # Remove user from the network along with every reference to it
+    # Only the departed node's neighbors, links, and the routes through it are visited
     def removeUser(self, exitUser):
         # Check if the prompted user is in the network and proceed
-        if exitUser.IP in self.network.keys():
-            del self.network[exitUser.IP]
-            self.updateNetwork()
+        if exitUser is None or exitUser.ID not in self.network:
+            return False
+
+        del self.network[exitUser.ID]
+        self.joinOrder.pop(exitUser.ID, None)
+
+        # OGMs it already transmitted are dropped before they bring back routes through it
+        for each in set(exitUser.listedBy.values() + exitUser.neighbors):
+            if each.ID in self.network:
+                self.lose(each.purgeReceived(exitUser.ID))
+
+        # Nodes listing it drop it as a neighbor (and their routes through it) and any packets queued to it
+        for each in exitUser.listedBy.values():
+            each.removeNeighbor(exitUser)
+            self.lose(each.purgeQueued(exitUser.ID))
+
+        exitUser.detach()
+        self.detector.forget(exitUser.ID)
+
+        # Packets waiting on its links are lost
+        for key in self.nodeLinks.pop(exitUser.ID, set()):
+            self.lose(self.links.pop(key).flush())
+            self.activeLinks.discard(key)
+
+            other = key[1] if key[0] == exitUser.ID else key[0]
+            if other in self.nodeLinks:
+                self.nodeLinks[other].discard(key)
+
+        return True
+
+    # Rank of a node in join order (-1 for a node not in the network)
+    def rank(self, nodeID):
+        return self.joinOrder.get(nodeID, -1)
+
+    # Sort key ordering links by the join order of their ends
+    def linkRank(self, key):
+        return self.joinOrder.get(key[0], -1), self.joinOrder.get(key[1], -1)
+
+    # Record packets as lost, the oldest ones leaving the history once it is full
+    def lose(self, packets):
+        for packet in packets:
+            if len(self.lostOGMs) == self.lostOGMs.maxlen:
+                memory.hold(self.lostHeld, self.lostOGMs[0], -1)
+            self.lostOGMs.append(packet)
+            memory.hold(self.lostHeld, packet)
+
+        self.lostCount += len(packets)
+
+    # Return the user node with the given IP (None if it is not in the network)
+    def findUser(self, ip):
+        nodeID = registry.find(ip)
+        if nodeID is None:
+            return None
+
+        return self.network.get(nodeID)
 
     # Update the all net dictionary of each node when a new node enters
     def updateNetwork(self):
         for key, value in self.network.iteritems():
-            value.allNet = self.network
+            self.attach(value)
+
+    # Share the network, the run-wide records, and the current time step with one node (the rest already hold them)
+    def attach(self, value):
+        value.allNet = self.network
+        value.deliveryStats = self.deliveryStats
+        value.timeline = self.timeline
+        value.detector = self.detector
+        value.changedNodes = self.changedNodes
+        value.tracked = self.tracked
+        value.clock = self.clock
+
+    # Track only a random sample of count originators plus the given IPs under study (sampled mode)
+    # Every node then keeps routes toward at most that many originators, so state grows as O(n*k)
+    def sampleOriginators(self, count=0, ips=(), seed=None):
+        tracked = set([registry.intern(ip) for ip in ips])
+        candidates = [each for each in self.network if each not in tracked]
+        tracked.update(random.Random(seed).sample(candidates, min(count, len(candidates))))
+
+        self.tracked = tracked
+        self.updateNetwork()
+
+        # Routes toward originators no longer tracked are dropped
+        for key, value in self.network.iteritems():
+            for originator in [each for each in value.receivedOGMs if each not in tracked and each != key]:
+                value.dropRoute(originator)
+
+        return tracked
+
+    # Leave sampled mode and track every originator again
+    def trackAll(self):
+        self.tracked = None
+        self.updateNetwork()
+
+    # Estimate network-wide routing from the tracked originators in O(n*k)
+    # Reachability is the share of (node, tracked originator) pairs with a route, and an originator has
+    # converged once every other node routes toward it (at the latest first-learned time step)
+    def samplingEstimate(self):
+        nodes = len(self.network)
+        tracked = [each for each in (self.tracked if self.tracked is not None else self.network)
+                   if each in self.network]
+
+        reached = dict([(originator, 0) for originator in tracked])
+        for key, value in self.network.iteritems():
+            for originator in value.receivedOGMs:
+                if originator in reached and originator != key:
+                    reached[originator] += 1
+
+        convergence = []
+        for originator in tracked:
+            if reached[originator] == nodes - 1 and nodes > 1:
+                convergence.append(max([self.timeline.firstLearned(key, originator) or 0
+                                        for key in self.network if key != originator]))
+        convergence.sort()
+
+        pairs = len(tracked) * (nodes - 1)
+        reachability = float(sum(reached.itervalues())) / pairs if pairs > 0 else 0.0
+
+        return {"tracked": len(tracked),
+                "nodes": nodes,
+                "reachability": reachability,
+                "routesEstimate": int(round(reachability * nodes * (nodes - 1))),
+                "converged": float(len(convergence)) / len(tracked) if len(tracked) > 0 else 0.0,
+                "convergenceP50": convergence[len(convergence) // 2] if len(convergence) > 0 else None,
+                "convergenceMax": convergence[-1] if len(convergence) > 0 else None,
+                "ogmsSuppressed": sum([value.ogmsSuppressed for value in self.network.itervalues()]),
+                "untrackedOGMs": sum([value.untrackedOGMs for value in self.network.itervalues()])}
+
+    # Load a scenario whose events are applied as the clock reaches them
+    def loadScenario(self, scenario):
+        self.scenario = scenario
+
+    # Register a function to be called with the transported hops after every time step
+    # An observer only watches the simulation, so branches leave it out unless asked for it
+    def addListener(self, listener, observer=False):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+        if observer and listener not in self.observers:
+            self.observers.append(listener)
+
+    # Unregister a time step listener
+    def removeListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+        if listener in self.observers:
+            self.observers.remove(listener)
+
+    # Listeners a branch runs with: the ones driving the simulation (traffic, mobility, memory sampling),
+    # and the observers only when asked for
+    def branchListeners(self, observers):
+        if observers:
+            return list(self.listeners)
+
+        return [listener for listener in self.listeners if listener not in self.observers]
+
+    # Set the capacity (packets per time step) of the link between two nodes, both ways unless one way is given
+    def setLinkCapacity(self, source, destination, capacity, oneWay=False):
+        source = registry.intern(source)
+        destination = registry.intern(destination)
+
+        pairs = [(source, destination)]
+        if not oneWay:
+            pairs.append((destination, source))
+
+        for pair in pairs:
+            self.capacities[pair] = capacity
+            if pair in self.links:
+                self.links[pair].capacity = capacity
+
+    # Set the queue limit and drop policy of every node in the network
+    def setQueuePolicy(self, policy, limit=None):
+        if policy not in user.DROP_POLICIES:
+            return False
+
+        # The drop policy is shown in the nodes' drops report section
+        for key, value in self.network.iteritems():
+            if value.dropPolicy != policy:
+                value.dropPolicy = policy
+                value.changed("drops")
+            if limit is not None:
+                value.queueLimit = limit
+
+        return True
+
+    # Return the link from a node toward its next hop, creating it if needed
+    def link(self, source, destination):
+        key = (source, destination)
+        if key not in self.links:
+            self.links[key] = link.Link(source, destination, self.capacities.get(key, self.linkCapacity))
+            self.nodeLinks.setdefault(source, set()).add(key)
+            self.nodeLinks.setdefault(destination, set()).add(key)
+
+        return self.links[key]
+
+    # Take down the link between two nodes both ways: waiting packets are lost and OGMs
+    # delivered over it but not yet processed are discarded
+    def cutLink(self, first, second):
+        for pair in ((first, second), (second, first)):
+            if pair in self.links:
+                self.lose(self.links[pair].flush())
+                self.activeLinks.discard(pair)
+
+            receiver = self.network.get(pair[1])
+            if receiver is not None:
+                self.lose(receiver.purgeReceived(pair[0]))
+
+    # Replace the OGMs in a send queue with one frame per next hop (data packets are left as they are)
+    def aggregateQueue(self, sender, queue):
+        outgoing = []
+        groups = {}
+        for packet in queue:
+            if packet.payload != "":
+                outgoing.append(packet)
+            elif packet.nextHop in groups:
+                groups[packet.nextHop].append(packet)
+            else:
+                groups[packet.nextHop] = [packet]
+                outgoing.append(groups[packet.nextHop])
+
+        # Lone OGMs go out unframed
+        for index, each in enumerate(outgoing):
+            if isinstance(each, list):
+                if len(each) == 1:
+                    outgoing[index] = each[0]
+                else:
+                    outgoing[index] = ogm.Frame(sender=sender, nextHop=each[0].nextHop, packets=each)
+                    self.framesSent += 1
+                    self.ogmsAggregated += len(each)
+
+        return outgoing
 
     # Clear the network of current user nodes
     def clear(self):
         self.network.clear()
-        self.lostOGMs = []
+        self.joinOrder.clear()
+        self.lostOGMs.clear()
+        self.lostCount = 0
+        self.lostHeld = memory.newHeld()
+        self.links = {}
+        self.nodeLinks = {}
+        self.activeLinks = set()
+        self.framesSent = 0
+        self.ogmsAggregated = 0
+        self.clock = 0
+        self.scenario = None
+        self.deliveryStats.clear()
+        self.timeline.clear()
+        self.detector.clear()
+        self.changedNodes.clear()
+        self.tracked = None
+
+    # Fork the simulation into one child process per branch and return each branch's measurements in order
+    # A branch is a function called with the branched controller, a Scenario to load, or None to just run on;
+    # every branch then runs ticks more steps and measure(controller) (summary by default) is sent back
+    # Children share the parent's memory copy-on-write, so each branch only costs the steps after the fork
+    # Observer listeners (the GUI animator, a capture file) belong to the parent and only run in branches with
+    # observers set; the listeners driving the simulation (traffic, mobility, memory sampling) always run
+    def branch(self, branches, ticks, measure=None, processes=None, observers=False):
+        if measure is None:
+            measure = Controller.summary
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        # Without fork every branch runs in turn on a deep copy
+        if not hasattr(os, "fork"):
+            saved = self.listeners, self.observers
+            self.listeners = self.branchListeners(observers)
+            self.observers = []
+            try:
+                return [copy.deepcopy(self).runBranch(each, ticks, measure) for each in branches]
+            finally:
+                self.listeners, self.observers = saved
+
+        results = [None] * len(branches)
+        pending = list(enumerate(branches))
+
+        # Running convention: <key>pipe read descriptor : <value> (process ID, branch index, data chunks)
+        running = {}
+
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < max(processes, 1):
+                index, each = pending.pop(0)
+                readFD, writeFD = os.pipe()
+
+                pid = os.fork()
+                if pid == 0:
+                    os.close(readFD)
+                    self.runChild(each, ticks, measure, writeFD, observers)
+
+                os.close(writeFD)
+                running[readFD] = (pid, index, [])
+
+            for readFD in select.select(list(running), [], [])[0]:
+                data = os.read(readFD, 65536)
+                if len(data) > 0:
+                    running[readFD][2].append(data)
+                    continue
+
+                pid, index, chunks = running.pop(readFD)
+                os.close(readFD)
+                os.waitpid(pid, 0)
+
+                try:
+                    results[index] = pickle.loads("".join(chunks))
+                except Exception:
+                    results[index] = {"error": "branch " + str(index) + " ended without sending its result"}
+
+        return results
+
+    # Apply a branch and run it, returning its measurements
+    def runBranch(self, branch, ticks, measure):
+        if isinstance(branch, scenario.Scenario):
+            self.loadScenario(branch)
+        elif branch is not None:
+            branch(self)
+
+        self.tick(ticks)
+        return measure(self)
+
+    # Body of a branch child process: run the branch, pickle the result down the pipe, and exit
+    def runChild(self, branch, ticks, measure, writeFD, observers):
+        try:
+            # The collector would touch every object and copy the shared pages for nothing
+            gc.disable()
+            self.listeners = self.branchListeners(observers)
+            self.observers = []
+
+            try:
+                data = pickle.dumps(self.runBranch(branch, ticks, measure), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                data = pickle.dumps({"error": traceback.format_exc()}, pickle.HIGHEST_PROTOCOL)
+
+            while len(data) > 0:
+                data = data[os.write(writeFD, data):]
+        finally:
+            os._exit(0)
+
+    # Summary metrics of the simulation as a dictionary
+    def summary(self):
+        nodes = len(self.network)
+        routes = 0
+        delivered = 0
+        drops = 0
+        for key, value in self.network.iteritems():
+            for originator in value.receivedOGMs:
+                if originator in self.network and originator != key:
+                    routes += 1
+            delivered += value.messagesDelivered
+            drops += value.dropCount()
+
+        delivery = self.deliveryStats.percentiles()
+
+        # In sampled mode the reachability is estimated from the tracked originators
+        reachability = float(routes) / (nodes * (nodes - 1)) if nodes > 1 else 0.0
+        if self.tracked is not None:
+            reachability = self.samplingEstimate()["reachability"]
+
+        # Memory as of the latest sample, when accounting
+        memoryBytes = None
+        if self.memory is not None and self.memory.latest() is not None:
+            memoryBytes = memory.tallyBytes(self.memory.latest()[1])
+
+        return {"clock": self.clock,
+                "nodes": nodes,
+                "routes": routes,
+                "reachability": reachability,
+                "delivered": delivered,
+                "latencyP50": delivery["latencyP50"],
+                "latencyP99": delivery["latencyP99"],
+                "hopsP50": delivery["hopsP50"],
+                "lost": self.lostCount,
+                "drops": drops,
+                "routeChanges": self.timeline.changeTotal,
+                "spoofAlerts": self.detector.alertCount,
+                "memoryBytes": memoryBytes}
 
     # Report an array of IPs in the network
     def report(self):
-        return self.network.keys()
+        return [value.IP for value in self.network.itervalues()]
 
     # Report a string of current IPs and OGMs in the system
     def reportString(self):
         report = "Network:\n"
 
         for key, value in self.network.iteritems():
-            report += "IP: " + str(key) + "\n"
+            report += "IP: " + str(value.IP) + "\n"
+
+        report += "\nLink Queues:\n"
+        for key in sorted(self.activeLinks, key=self.linkRank):
+            report += self.links[key].reportString()
+
+        if self.framesSent > 0:
+            report += "Aggregation: " + str(self.ogmsAggregated) + " OGMs in " + str(self.framesSent) + " frames\n"
+
+        if self.scenario is not None:
+            report += self.scenario.reportString()
+
+        if self.detector.alertCount > 0:
+            report += self.detector.reportString(listing=False)
+
+        if self.memory is not None:
+            report += self.memory.reportString()
+
+        if self.tracked is not None:
+            estimate = self.samplingEstimate()
+            report += "Sampled Originators: " + str(estimate["tracked"]) + " of " + str(estimate["nodes"]) + \
+                      ", reachability ~" + "%.3f" % estimate["reachability"] + ", converged " + \
+                      "%.2f" % estimate["converged"] + " (P50 " + str(estimate["convergenceP50"]) + ", max " + \
+                      str(estimate["convergenceMax"]) + "), " + str(estimate["ogmsSuppressed"]) + " OGMs not sent\n"
 
-        report += "\nLost OGMS:\n"
+        report += "\n" + self.deliveryStats.reportString(self.flowName)
+
+        report += "\nLost OGMS: " + str(self.lostCount)
+        if self.lostCount > len(self.lostOGMs):
+            report += " (latest " + str(len(self.lostOGMs)) + " listed)"
+        report += "\n"
         for index in self.lostOGMs:
             report += "OGM source IP: " + str(index.senderIP) + "Sequence: " + str(index.sequence) + "\n"
 
         return report
 
+    # Report the route history of a node toward an originator (both IPs) to a string
+    def reportRouteHistory(self, ip, originator):
+        nodeID = registry.find(ip)
+        originID = registry.find(originator)
+        if nodeID is None or originID is None:
+            return "Route History " + str(ip) + " -> " + str(originator) + ":\nUnknown IP\n"
+
+        return self.timeline.reportString(nodeID, originID)
+
+    # Report the changes of only the nodes that changed since the previous delta report
+    def reportDeltaString(self):
+        report = ""
+        for nodeID in sorted(self.changedNodes):
+            if nodeID in self.network:
+                report += self.network[nodeID].reportDelta()
+
+        self.changedNodes.clear()
+        return report
+
+    # Name a delivery flow for reports (flows without a key are (originator ID, destination ID) pairs)
+    def flowName(self, flow):
+        if isinstance(flow, tuple):
+            return registry.ip(flow[0]) + "->" + registry.ip(flow[1])
+
+        return str(flow)
+
     # Creates a graph of all nodes and shared neighbors present in the system
     def reportGraph(self):
         # Create and populate the nodes and edges shared between users
@@ -74,11 +568,11 @@ class Controller:
         edges = []
 
         for key, value in self.network.iteritems():
-            nodes.append(key)
+            nodes.append(value.IP)
 
             # Create the edges based on the user node's neighbors listing
             for index in value.neighbors:
-                edges.append((key, index.IP))
+                edges.append((value.IP, index.IP))
 
         # Create the graph
         graph = netx.Graph()
@@ -94,25 +588,79 @@ class Controller:
     def tick(self, deltaTime):
         # All actions performed by controller for each step in time
         for count in range(0, deltaTime):
+            # Every node is at this step's time before anything happens in it
+            for key, value in self.network.iteritems():
+                value.clock = self.clock
+
+            # Apply the scenario events due at this step
+            if self.scenario is not None and len(self.scenario) > 0:
+                self.scenario.apply(self)
+
             # Call user node tick functions
             for key, value in self.network.iteritems():
-                value.tick(count)
+                value.tick(1)
 
             # Generate OGMs for those that have met their time to cast
             for key, value in self.network.iteritems():
-                value.broadcastOGMs(count)
+                value.broadcastOGMs(1)
 
-            # Retrieve an OGM from each user's receive queue
+            # Process the delivered packets in each user's receive queue
             for key, value in self.network.iteritems():
-                value.receiveOGM()
+                value.receiveOGMs(self.receiveRate)
 
-            # Transport one of the generated OGMs to their next hops from each node
+            # Stage every queued packet on the link toward its next hop
             for key, value in self.network.iteritems():
                 if len(value.sendQueue) > 0:
-                    outgoingOGM = value.sendQueue.pop(0)
-                    # Check the network for a valid IP corresponding to next hop
-                    if outgoingOGM.nextHop in self.network.keys():
-                        destination = self.network[outgoingOGM.nextHop]
-                        destination.receiveQueue.append(outgoingOGM)
-                    else:
-                        self.lostOGMs.append(outgoingOGM)
+                    outgoingQueue = value.sendQueue
+                    if self.aggregate:
+                        outgoingQueue = self.aggregateQueue(key, value.sendQueue)
+
+                    for outgoingOGM in outgoingQueue:
+                        # Check the network for a valid IP corresponding to next hop
+                        if outgoingOGM.nextHop in self.network:
+                            outgoingOGM.queuedAt = self.clock
+                            outgoingLink = self.link(key, outgoingOGM.nextHop)
+                            if value.enqueue(outgoingLink.queue, outgoingOGM, "link", outgoingLink.held):
+                                self.activeLinks.add((key, outgoingOGM.nextHop))
+                        else:
+                            self.lose([outgoingOGM])
+
+                    value.clearQueue("send")
+
+            # Each link delivers up to its capacity into the receiver in one batch, in join order
+            hops = []
+            for linkKey in sorted(self.activeLinks, key=self.linkRank):
+                outgoing = self.links[linkKey]
+
+                if outgoing.destination not in self.network:
+                    self.lose(outgoing.flush())
+                    self.activeLinks.discard(linkKey)
+                    continue
+
+                batch = outgoing.deliver(self.clock, self.network.get(outgoing.source))
+                if len(outgoing) == 0:
+                    self.activeLinks.discard(linkKey)
+
+                if len(batch) > 0:
+                    # Frames are unpacked into the receiver's queue, each packet stamped with the transmitting node
+                    unpacked = []
+                    for packet in batch:
+                        if isinstance(packet, ogm.Frame):
+                            for each in packet.packets:
+                                each.transmitter = outgoing.source
+                            unpacked.extend(packet.packets)
+                        else:
+                            packet.transmitter = outgoing.source
+                            unpacked.append(packet)
+
+                    receiver = self.network[outgoing.destination]
+                    receiver.enqueueBatch(receiver.receiveQueue, unpacked, "receive")
+
+                    # Hops are only collected when someone is listening
+                    if self.listeners:
+                        for packet in batch:
+                            hops.append((outgoing.source, outgoing.destination, packet))
+
+            self.clock += 1
+            for listener in self.listeners:
+                listener(self.clock, hops)
@@ -0,0 +1,172 @@
+################################################################################
+# detector.py                                                                  #
+# Streaming spoof detection for the BATMAN Simulator. Every OGM a node         #
+# receives is checked inline against compact state kept per (receiver,         #
+# originator): the newest sequence seen, the shortest settled hop distance,    #
+# and a few of the first-hop senders. An alert is raised the moment a claimed  #
+# originator shows up from an inconsistent direction: sent by a node other     #
+# than the one transmitting it, suddenly much closer than it has been, or      #
+# with a sequence far outside its progression. Each check is constant time.    #
+################################################################################
+
+import collections
+
+import registry
+
+
+# Alert kinds
+IMPERSONATION = "impersonation"
+DISTANCE = "distance"
+SEQUENCE = "sequence"
+KINDS = (IMPERSONATION, DISTANCE, SEQUENCE)
+
+# State fields per (receiver, originator): newest sequence, shortest hop distance, newer sequences seen,
+# first-hop senders (at most maxSenders of them), and the alert kinds already raised
+NEWEST = 0
+SHORTEST = 1
+SEEN = 2
+SENDERS = 3
+RAISED = 4
+
+
+class SpoofDetector:
+    # Constructor
+    # An originator settles after warmup newer sequences (copies of one sequence settle nothing); after that
+    # an OGM at least hopSlack hops closer than the shortest distance seen, or a sequence more than
+    # sequenceWindow behind or ahead of the newest, is suspect
+    def __init__(self, warmup=3, hopSlack=2, sequenceWindow=64, maxSenders=4, alertLimit=1000):
+        self.warmup = warmup
+        self.hopSlack = hopSlack
+        self.sequenceWindow = sequenceWindow
+        self.maxSenders = maxSenders
+        self.enabled = True
+
+        # State convention: <key>receiver ID : <value> dictionary of <key>originator ID : <value>
+        # [newest, shortest, seen, senders, raised], with the receivers holding state about each originator
+        # Heard by convention: <key>originator ID : <value> set of receiver IDs
+        self.state = {}
+        self.heardBy = {}
+
+        # Alerts convention: the latest (time step, kind, receiver ID, originator ID, detail) tuples
+        self.alerts = collections.deque(maxlen=alertLimit)
+        self.alertCount = 0
+        self.counts = dict([(kind, 0) for kind in KINDS])
+
+        # Suspects convention: <key>originator ID : <value> alerts raised about it
+        self.suspects = {}
+        self.checked = 0
+
+    # Check one OGM arriving at a receiver, returning the alert kind raised (None if it looks consistent)
+    def check(self, receiver, packet):
+        if not self.enabled:
+            return None
+
+        self.checked += 1
+        originator = packet.originator
+        hops = len(packet.traceroute)
+
+        table = self.state.get(receiver.ID)
+        if table is None:
+            table = self.state[receiver.ID] = {}
+
+        entry = table.get(originator)
+        if entry is None:
+            entry = [packet.sequence, hops, 0, (packet.sender,), 0]
+            table[originator] = entry
+            self.heardBy.setdefault(originator, set()).add(receiver.ID)
+
+        alert = None
+
+        # The node that actually transmitted the OGM must be the sender it names
+        if packet.transmitter is not None and packet.transmitter != packet.sender:
+            alert = self.raiseAlert(receiver, entry, IMPERSONATION, packet)
+
+        if entry[SEEN] >= self.warmup:
+            # A settled originator suddenly appearing much closer comes from a new direction
+            if hops + self.hopSlack <= entry[SHORTEST] and packet.sender not in entry[SENDERS]:
+                alert = self.raiseAlert(receiver, entry, DISTANCE, packet)
+
+            # Sequences from one originator advance together, a second stream shows up far outside them
+            gap = packet.sequence - entry[NEWEST]
+            if gap > self.sequenceWindow or -gap > self.sequenceWindow:
+                alert = self.raiseAlert(receiver, entry, SEQUENCE, packet)
+
+        # Update the state (the distance only settles from consistent OGMs)
+        if packet.sequence > entry[NEWEST]:
+            entry[NEWEST] = packet.sequence
+            entry[SEEN] += 1
+        if alert is None and hops < entry[SHORTEST]:
+            entry[SHORTEST] = hops
+        if packet.sender not in entry[SENDERS] and len(entry[SENDERS]) < self.maxSenders:
+            entry[SENDERS] = entry[SENDERS] + (packet.sender,)
+
+        return alert
+
+    # Record an alert, listing only the first of each kind per (receiver, originator)
+    def raiseAlert(self, receiver, entry, kind, packet):
+        self.alertCount += 1
+        self.counts[kind] += 1
+        self.suspects[packet.originator] = self.suspects.get(packet.originator, 0) + 1
+
+        bit = 1 << KINDS.index(kind)
+        if not entry[RAISED] & bit:
+            entry[RAISED] |= bit
+            self.alerts.append((receiver.clock, kind, receiver.ID, packet.originator, self.describe(kind, packet, entry)))
+
+        return kind
+
+    # Describe what made an OGM suspect
+    def describe(self, kind, packet, entry):
+        if kind == IMPERSONATION:
+            return "sent by " + registry.ip(packet.transmitter) + " as " + registry.ip(packet.sender)
+        if kind == DISTANCE:
+            return str(len(packet.traceroute) - 1) + " hops via " + registry.ip(packet.sender) + ", was " + \
+                   str(entry[SHORTEST] - 1)
+
+        return "sequence " + str(packet.sequence) + ", newest " + str(entry[NEWEST])
+
+    # Forget the state a node held and the state held about it (a node rejoining starts over)
+    def forget(self, nodeID):
+        for originator in self.state.pop(nodeID, {}):
+            receivers = self.heardBy[originator]
+            receivers.discard(nodeID)
+            if len(receivers) == 0:
+                del self.heardBy[originator]
+
+        for receiver in self.heardBy.pop(nodeID, set()):
+            table = self.state[receiver]
+            del table[nodeID]
+            if len(table) == 0:
+                del self.state[receiver]
+
+    # Forget all state and alerts
+    def clear(self):
+        self.state = {}
+        self.heardBy = {}
+        self.alerts.clear()
+        self.alertCount = 0
+        self.counts = dict([(kind, 0) for kind in KINDS])
+        self.suspects = {}
+        self.checked = 0
+
+    # Alerts raised from a time step on
+    def alertsSince(self, clock):
+        return [each for each in self.alerts if each[0] >= clock]
+
+    # Report the alert counts and suspects to a string, listing the alerts from a time step on (all for None)
+    def reportString(self, since=None, listing=True):
+        report = "Spoof Alerts: " + str(self.alertCount) + " in " + str(self.checked) + " OGMs checked ("
+        report += ", ".join([kind + " " + str(self.counts[kind]) for kind in KINDS]) + ")\n"
+
+        alerts = []
+        if listing:
+            alerts = self.alerts if since is None else self.alertsSince(since)
+
+        for clock, kind, receiver, originator, detail in alerts:
+            report += "Time: " + str(clock) + " " + registry.ip(receiver) + " " + kind + " of " + \
+                      registry.ip(originator) + ": " + detail + "\n"
+
+        for originator in sorted(self.suspects, key=self.suspects.get, reverse=True)[:10]:
+            report += "Suspect " + registry.ip(originator) + ": " + str(self.suspects[originator]) + " alerts\n"
+
+        return report
@@ -0,0 +1,259 @@
+################################################################################
+# emulator.py                                                                  #
+# Real-time emulation mode for the BATMAN Simulator. Every user node gets its  #
+# own UDP socket on the loopback interface and a timer that fires once per     #
+# time step of wall-clock time, all driven by one event loop. OGMs and         #
+# messages travel as encoded datagrams (see wire.py) and are handled by the    #
+# same receive and forward logic as the simulation. The loop measures how far  #
+# each timer slipped behind its schedule, so the number of nodes one loop can  #
+# sustain at real beacon rates can be found.                                   #
+################################################################################
+
+import errno
+import heapq
+import select
+import socket
+import time
+
+import histogram
+import wire
+
+
+class Emulator:
+    # Constructor - every time step lasts tickSeconds of wall-clock time
+    def __init__(self, controller, tickSeconds=0.1, host="127.0.0.1"):
+        self.controller = controller
+        self.tickSeconds = tickSeconds
+        self.host = host
+
+        # Sockets convention: <key>node ID : <value> socket, with addresses and file descriptors mapped back
+        self.sockets = {}
+        self.addresses = {}
+        self.descriptors = {}
+        self.nodesByAddress = {}
+
+        # Timers convention: heap of (due time, node ID), one per node
+        self.timers = []
+        self.startTime = 0.0
+        self.poller = None
+
+        self.sendBuffer = bytearray(wire.MAX_DATAGRAM)
+        self.receiveBuffer = bytearray(wire.MAX_DATAGRAM)
+
+        # Timer slip in microseconds, and timers that fired a whole time step or more late
+        self.slip = histogram.Histogram()
+        self.late = 0
+        self.fired = 0
+
+        self.datagramsSent = 0
+        self.datagramsReceived = 0
+        self.bytesSent = 0
+        self.sendErrors = 0
+        self.lost = 0
+
+    # Open a socket for every node and schedule the node timers, staggered across one time step
+    def start(self):
+        self.close()
+
+        if hasattr(select, "epoll"):
+            self.poller = select.epoll()
+
+        ids = self.controller.network.keys()
+        for nodeID in ids:
+            nodeSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            nodeSocket.bind((self.host, 0))
+            nodeSocket.setblocking(False)
+
+            self.sockets[nodeID] = nodeSocket
+            self.addresses[nodeID] = nodeSocket.getsockname()
+            self.nodesByAddress[self.addresses[nodeID]] = nodeID
+            self.descriptors[nodeSocket.fileno()] = nodeID
+            if self.poller is not None:
+                self.poller.register(nodeSocket.fileno(), select.EPOLLIN)
+
+        self.startTime = time.time()
+        for index, nodeID in enumerate(ids):
+            heapq.heappush(self.timers, (self.startTime + self.tickSeconds * index / len(ids), nodeID))
+
+    # Run the event loop for a number of wall-clock seconds
+    def run(self, seconds):
+        if len(self.sockets) == 0:
+            self.start()
+
+        end = time.time() + seconds
+        while True:
+            now = time.time()
+            if now >= end:
+                break
+
+            timeout = end - now
+            if len(self.timers) > 0:
+                timeout = min(timeout, max(self.timers[0][0] - now, 0.0))
+
+            for nodeID in self.wait(timeout):
+                self.receive(nodeID)
+
+            # Fire every timer that is due
+            now = time.time()
+            while len(self.timers) > 0 and self.timers[0][0] <= now:
+                due, nodeID = heapq.heappop(self.timers)
+                if nodeID not in self.sockets:
+                    continue
+
+                self.measure(now - due)
+                self.step(nodeID)
+
+                # The next step keeps to the schedule, so a late timer does not shift the ones after it
+                heapq.heappush(self.timers, (due + self.tickSeconds, nodeID))
+
+        self.controller.clock = self.clockNow()
+        return self.report()
+
+    # Wait up to timeout seconds for datagrams, returning the IDs of the nodes with one waiting
+    def wait(self, timeout):
+        if self.poller is not None:
+            return [self.descriptors[fd] for fd, event in self.poller.poll(timeout) if fd in self.descriptors]
+
+        readable = select.select([each for each in self.sockets.itervalues()], [], [], timeout)[0]
+        return [self.descriptors[each.fileno()] for each in readable]
+
+    # Time step of the emulation at the current wall-clock time
+    def clockNow(self):
+        return int((time.time() - self.startTime) / self.tickSeconds)
+
+    # Record how late a timer fired
+    def measure(self, lateness):
+        self.fired += 1
+        self.slip.record(int(max(lateness, 0.0) * 1000000))
+        if lateness >= self.tickSeconds:
+            self.late += 1
+
+    # One node time step: age state, beacon, process received packets, and send the queued ones
+    def step(self, nodeID):
+        node = self.controller.network.get(nodeID)
+        if node is None:
+            return
+
+        node.clock = self.clockNow()
+        node.tick(1)
+        node.broadcastOGMs(1)
+        node.receiveOGMs()
+        self.send(nodeID, node)
+
+    # Drain every datagram waiting on a node's socket into its receive queue
+    def receive(self, nodeID):
+        node = self.controller.network.get(nodeID)
+        nodeSocket = self.sockets[nodeID]
+
+        while True:
+            try:
+                size, address = nodeSocket.recvfrom_into(self.receiveBuffer)
+            except socket.error as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+
+            self.datagramsReceived += 1
+            if node is not None:
+                # The source address of the datagram tells which node transmitted it
+                packets = wire.decode(memoryview(self.receiveBuffer)[:size])
+                for packet in packets:
+                    packet.transmitter = self.nodesByAddress.get(address)
+                node.enqueueBatch(node.receiveQueue, packets, "receive")
+
+    # Send a node's queued packets as one datagram per next hop (split when it would not fit)
+    def send(self, nodeID, node):
+        if len(node.sendQueue) == 0:
+            return
+
+        outgoing = node.sendQueue
+        if self.controller.aggregate:
+            outgoing = self.controller.aggregateQueue(nodeID, node.sendQueue)
+
+        for packet in outgoing:
+            if packet.nextHop not in self.addresses:
+                self.controller.lose([packet])
+                self.lost += 1
+                continue
+
+            # An oversized frame is split into datagrams of whole OGMs
+            for batch in wire.datagrams(packet):
+                self.sendDatagram(nodeID, packet.nextHop, batch)
+
+        node.clearQueue("send")
+
+    # Encode packets into the shared buffer and send them to a node as one datagram
+    def sendDatagram(self, source, destination, packets):
+        end = 0
+        for packet in packets:
+            end = wire.packInto(self.sendBuffer, end, packet)
+
+        try:
+            self.sockets[source].sendto(memoryview(self.sendBuffer)[:end], self.addresses[destination])
+            self.datagramsSent += 1
+            self.bytesSent += end
+        except socket.error as error:
+            if error.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                raise
+            self.sendErrors += 1
+
+    # Close every socket and forget the timers
+    def close(self):
+        for each in self.sockets.itervalues():
+            each.close()
+
+        if self.poller is not None:
+            self.poller.close()
+            self.poller = None
+
+        self.sockets = {}
+        self.addresses = {}
+        self.descriptors = {}
+        self.nodesByAddress = {}
+        self.timers = []
+
+    # Report the measurements as a dictionary (slip in milliseconds)
+    def report(self):
+        elapsed = max(time.time() - self.startTime, 0.0)
+
+        return {"nodes": len(self.sockets),
+                "seconds": elapsed,
+                "timers": self.fired,
+                "late": self.late,
+                "lateRate": float(self.late) / self.fired if self.fired > 0 else 0.0,
+                "slipP50": (self.slip.percentile(50) or 0) / 1000.0,
+                "slipP99": (self.slip.percentile(99) or 0) / 1000.0,
+                "slipMax": (self.slip.max or 0) / 1000.0,
+                "datagramsSent": self.datagramsSent,
+                "datagramsReceived": self.datagramsReceived,
+                "bytesSent": self.bytesSent,
+                "sendErrors": self.sendErrors,
+                "lost": self.lost}
+
+    # Report the measurements to a string
+    def reportString(self):
+        report = self.report()
+        keys = ("nodes", "seconds", "timers", "late", "lateRate", "slipP50", "slipP99", "slipMax", "datagramsSent",
+                "datagramsReceived", "bytesSent", "sendErrors", "lost")
+
+        output = "Emulation Report:\n"
+        for key in keys:
+            output += key + ": " + str(report[key]) + "\n"
+
+        return output
+
+
+# Emulate networks of increasing size from build(size) and report how well the one loop kept its timers
+def capacity(build, sizes, seconds=5.0, tickSeconds=0.1):
+    reports = []
+    for size in sizes:
+        emulator = Emulator(build(size), tickSeconds)
+        try:
+            report = emulator.run(seconds)
+        finally:
+            emulator.close()
+
+        report["size"] = size
+        reports.append(report)
+
+    return reports
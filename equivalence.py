@@ -0,0 +1,281 @@
+################################################################################
+# equivalence.py                                                               #
+# Differential equivalence harness for the BATMAN Simulator. A candidate       #
+# engine (any factory returning a controller-like object with tick, network,   #
+# loadScenario, and lostOGMs) runs side by side with the reference controller  #
+# on generated scenarios. Their routing knowledge, sequence numbers,           #
+# delivered messages, and lost OGMs are compared at every checkpoint, a        #
+# failing scenario is shrunk to a minimal reproducer, and the speedup of the   #
+# candidate is reported per scenario.                                          #
+#                                                                              #
+# Usage: python equivalence.py <module>:<factory> [scenarios] [nodes] [ticks]  #
+################################################################################
+
+import importlib
+import random
+import sys
+import time
+
+import controller
+import ogm
+import registry
+import scenario
+
+
+# Generate a scenario: nodes joining at time step 0 in a connected mesh, then churn, link changes,
+# messages, and spoofing spread over the run
+# Events convention: (time step, event, argument tuple) as added to a Scenario
+def generate(seed, nodes=12, ticks=60, events=20):
+    generator = random.Random(seed)
+    ips = ["10.250." + str(seed % 256) + "." + str(index + 1) for index in range(0, nodes)]
+
+    generated = []
+    for index, ip in enumerate(ips):
+        neighbors = ()
+        if index > 0:
+            neighbors = tuple(set([ips[index - 1]] + generator.sample(ips[:index], min(index, 2))))
+        generated.append((0, "join", (ip, generator.randint(1, 5), generator.random() < 0.1, neighbors)))
+
+    present = list(ips)
+    spare = 0
+    for count in range(0, events):
+        clock = generator.randint(1, max(ticks - 1, 1))
+        kind = generator.choice(("join", "leave", "linkup", "linkdown", "message", "message", "spoof"))
+
+        if kind == "join":
+            ip = "10.251." + str(seed % 256) + "." + str(spare + 1)
+            spare += 1
+            generated.append((clock, "join", (ip, generator.randint(1, 5), False,
+                                              tuple(generator.sample(ips, min(len(ips), 2))))))
+            present.append(ip)
+        elif kind == "leave" and len(present) > 2:
+            generated.append((clock, "leave", (present.pop(generator.randrange(len(present))),)))
+        elif kind in ("linkup", "linkdown"):
+            first, second = generator.sample(ips, 2)
+            generated.append((clock, kind, (first, second)))
+        elif kind == "message":
+            first, second = generator.sample(ips, 2)
+            generated.append((clock, "message", (first, second, 180, "data " + str(count))))
+        elif kind == "spoof":
+            first, second = generator.sample(ips, 2)
+            generated.append((clock, "spoofstart", (first, second)))
+            generated.append((min(clock + generator.randint(1, 10), ticks), "spoofstop", (first,)))
+
+    return sorted(generated, key=lambda each: each[0])
+
+
+# Scenario holding a list of events
+def toScenario(events):
+    built = scenario.Scenario()
+    for clock, event, args in events:
+        built.add(clock, event, *args)
+
+    return built
+
+
+# Packets of a container, with aggregated frames opened up
+def packets(container):
+    for packet in container:
+        if isinstance(packet, ogm.Frame):
+            for each in packet.packets:
+                yield each
+        else:
+            yield packet
+
+
+# Comparable state of a simulation, by IP so the engines may number nodes differently
+def snapshot(simulation):
+    state = {}
+    for nodeID, node in simulation.network.iteritems():
+        routes = dict([(registry.ip(originator), (registry.ip(packet.sender), packet.sequence))
+                       for originator, packet in node.receivedOGMs.iteritems()])
+        messages = dict([(registry.ip(originator), (packet.sequence, str(packet.payload)))
+                         for originator, packet in node.receivedMessages.iteritems()])
+        state[node.IP] = {"sequence": node.sequence, "routes": routes, "messages": messages}
+
+    lost = sorted([(registry.ip(each.originator), registry.ip(each.sender), each.sequence)
+                   for each in packets(simulation.lostOGMs)])
+    return {"nodes": state, "lost": lost}
+
+
+# Differences between a reference and a candidate snapshot (at most limit of them)
+def differences(reference, candidate, limit=5):
+    found = []
+
+    missing = set(reference["nodes"]) ^ set(candidate["nodes"])
+    for ip in sorted(missing)[:limit]:
+        found.append("node " + ip + (" missing from candidate" if ip in reference["nodes"] else " extra in candidate"))
+
+    for ip in sorted(set(reference["nodes"]) & set(candidate["nodes"])):
+        expected = reference["nodes"][ip]
+        actual = candidate["nodes"][ip]
+        for field in ("sequence", "routes", "messages"):
+            if expected[field] == actual[field]:
+                continue
+
+            if field == "sequence":
+                found.append("node " + ip + " sequence " + str(expected[field]) + " != " + str(actual[field]))
+            else:
+                for key in sorted(set(expected[field]) | set(actual[field])):
+                    if expected[field].get(key) != actual[field].get(key):
+                        found.append("node " + ip + " " + field + " " + key + ": " + str(expected[field].get(key)) +
+                                     " != " + str(actual[field].get(key)))
+                        break
+
+        if len(found) >= limit:
+            return found[:limit]
+
+    if reference["lost"] != candidate["lost"]:
+        found.append("lost OGMs " + str(len(reference["lost"])) + " != " + str(len(candidate["lost"])))
+
+    return found[:limit]
+
+
+# Checkpoint time steps of a run: every interval steps and the last one
+def checkpoints(ticks, interval):
+    marks = range(interval, ticks, interval) if interval > 0 else []
+    return marks + [ticks]
+
+
+class Result:
+    # Constructor
+    def __init__(self, events, ticks):
+        self.events = events
+        self.ticks = ticks
+        self.referenceSeconds = 0.0
+        self.candidateSeconds = 0.0
+
+        # First checkpoint where the engines diverged (None when they agree) and what differed
+        self.divergedAt = None
+        self.differences = []
+
+    def speedup(self):
+        if self.candidateSeconds <= 0.0:
+            return None
+
+        return self.referenceSeconds / self.candidateSeconds
+
+    def reportString(self):
+        speedup = self.speedup()
+        report = str(len(self.events)) + " events, " + str(self.ticks) + " ticks: reference " + \
+                 "%.3fs" % self.referenceSeconds + ", candidate " + "%.3fs" % self.candidateSeconds + \
+                 (", speedup %.2fx" % speedup if speedup is not None else "")
+
+        if self.divergedAt is None:
+            return report + ", equivalent\n"
+
+        report += ", DIVERGED at time " + str(self.divergedAt) + "\n"
+        for each in self.differences:
+            report += "  " + each + "\n"
+
+        return report
+
+
+class Harness:
+    # Constructor - reference and candidate are factories of fresh simulations, state reduces one to a snapshot
+    def __init__(self, candidate, reference=controller.Controller, interval=10, state=snapshot):
+        self.candidate = candidate
+        self.reference = reference
+        self.interval = interval
+        self.state = state
+
+    # Run both engines on the events, comparing at each checkpoint and stopping at the first divergence
+    def compare(self, events, ticks):
+        result = Result(events, ticks)
+
+        referenceRun = self.reference()
+        candidateRun = self.candidate()
+        referenceRun.loadScenario(toScenario(events))
+        candidateRun.loadScenario(toScenario(events))
+
+        clock = 0
+        for mark in checkpoints(ticks, self.interval):
+            start = time.time()
+            referenceRun.tick(mark - clock)
+            result.referenceSeconds += time.time() - start
+
+            start = time.time()
+            candidateRun.tick(mark - clock)
+            result.candidateSeconds += time.time() - start
+            clock = mark
+
+            found = differences(self.state(referenceRun), self.state(candidateRun))
+            if len(found) > 0:
+                result.divergedAt = mark
+                result.differences = found
+                break
+
+        return result
+
+    # Shrink the events and ticks of a diverging scenario to a minimal one that still diverges
+    # Chunks of events are removed while the divergence remains, halving the chunk size when none can go
+    def shrink(self, events, ticks):
+        result = self.compare(events, ticks)
+        if result.divergedAt is None:
+            return result
+
+        chunks = 2
+        while len(result.events) > 1:
+            events = result.events
+            size = (len(events) + chunks - 1) // chunks
+            smaller = None
+
+            for start in range(0, len(events), size):
+                attempt = self.compare(events[:start] + events[start + size:], result.divergedAt)
+                if attempt.divergedAt is not None:
+                    smaller = attempt
+                    break
+
+            if smaller is not None:
+                result = smaller
+                chunks = max(chunks - 1, 2)
+            elif size == 1:
+                break
+            else:
+                chunks = min(chunks * 2, len(events))
+
+        # The run only has to reach the first diverging time step
+        return Harness(self.candidate, self.reference, 1, self.state).compare(result.events, result.divergedAt)
+
+    # Run generated scenarios, shrinking and saving a reproducer for each one that diverges
+    def run(self, seeds, nodes=12, ticks=60, events=20, reproducer="reproducer_"):
+        results = []
+        for seed in seeds:
+            result = self.compare(generate(seed, nodes, ticks, events), ticks)
+            if result.divergedAt is not None:
+                shrunk = self.shrink(result.events, ticks)
+                toScenario(shrunk.events).save(reproducer + str(seed) + ".txt")
+                result.differences = result.differences + ["minimal reproducer: " + str(len(shrunk.events)) +
+                                                           " events, " + str(shrunk.divergedAt) + " ticks in " +
+                                                           reproducer + str(seed) + ".txt"]
+
+            results.append((seed, result))
+
+        return results
+
+
+# Report the results of a harness run to a string
+def reportString(results):
+    report = ""
+    equivalent = 0
+    for seed, result in results:
+        report += "Scenario " + str(seed) + ": " + result.reportString()
+        if result.divergedAt is None:
+            equivalent += 1
+
+    return report + str(equivalent) + " of " + str(len(results)) + " scenarios equivalent\n"
+
+
+# Load a candidate factory named as module:attribute
+def loadFactory(name):
+    moduleName, attribute = name.split(":", 1)
+    return getattr(importlib.import_module(moduleName), attribute)
+
+
+if __name__ == '__main__':
+    candidate = loadFactory(sys.argv[1]) if len(sys.argv) > 1 else controller.Controller
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    nodes = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+    ticks = int(sys.argv[4]) if len(sys.argv) > 4 else 60
+
+    print reportString(Harness(candidate).run(range(1, count + 1), nodes, ticks))
@@ -0,0 +1,160 @@
+################################################################################
+# histogram.py                                                                 #
+# Compact log-bucketed histograms for the BATMAN Simulator delivery stats.     #
+# Values below 2^subBits are counted exactly and each larger power of two is   #
+# split into 2^subBits linear sub-buckets, so percentiles are accurate to a    #
+# few percent and a histogram never grows past a fixed number of buckets, no   #
+# matter how many values are recorded. Delivery stats keep latency (ticks)     #
+# and hop count histograms per flow and for the whole network.                 #
+################################################################################
+
+import math
+
+
+class Histogram:
+    # Constructor - values at or above 2^maxBits are counted in the last bucket
+    def __init__(self, subBits=4, maxBits=32):
+        self.subBits = subBits
+        self.subBuckets = 1 << subBits
+        self.limit = (maxBits - subBits + 1) * self.subBuckets
+
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    # Bucket index of a non-negative integer value
+    def bucket(self, value):
+        if value < self.subBuckets:
+            return value
+
+        shift = value.bit_length() - self.subBits - 1
+        return min(shift * self.subBuckets + (value >> shift), self.limit - 1)
+
+    # Highest value counted in a bucket
+    def upperBound(self, index):
+        if index < self.subBuckets:
+            return index
+
+        shift = index // self.subBuckets - 1
+        mantissa = index - shift * self.subBuckets
+        return ((mantissa + 1) << shift) - 1
+
+    # Record a value (negative values count as zero)
+    def record(self, value, times=1):
+        value = max(int(value), 0)
+        index = self.bucket(value)
+
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += times
+
+        self.count += times
+        self.total += value * times
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # Value at the given percentile (0-100), None when empty
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+
+        rank = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return max(min(self.upperBound(index), self.max), self.min)
+
+        return self.max
+
+    # Average of the recorded values, None when empty
+    def mean(self):
+        if self.count == 0:
+            return None
+
+        return float(self.total) / self.count
+
+    # Add the counts of another histogram with the same bucketing
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    # Report the usual summary percentiles to a string
+    def reportString(self):
+        return ("count: " + str(self.count) + " p50: " + str(self.percentile(50)) + " p99: " +
+                str(self.percentile(99)) + " max: " + str(self.max) + "\n")
+
+
+class DeliveryStats:
+    # Constructor
+    def __init__(self):
+        self.latency = Histogram()
+        self.hops = Histogram()
+
+        # Flows convention: <key>flow key : <value> (latency Histogram, hops Histogram)
+        self.flows = {}
+
+    # Record a delivered message for its flow and for the network
+    def record(self, flow, latency, hops):
+        if flow not in self.flows:
+            self.flows[flow] = (Histogram(), Histogram())
+
+        flowLatency, flowHops = self.flows[flow]
+        flowLatency.record(latency)
+        flowHops.record(hops)
+        self.latency.record(latency)
+        self.hops.record(hops)
+
+    # Latency and hop histograms merged over the given flow keys
+    def merged(self, flows):
+        latency = Histogram()
+        hops = Histogram()
+        for flow in flows:
+            if flow in self.flows:
+                latency.merge(self.flows[flow][0])
+                hops.merge(self.flows[flow][1])
+
+        return latency, hops
+
+    # Percentile summary for one flow (or the network when flow is None)
+    def percentiles(self, flow=None):
+        if flow is None:
+            latency, hops = self.latency, self.hops
+        elif flow in self.flows:
+            latency, hops = self.flows[flow]
+        else:
+            return None
+
+        return {"count": latency.count,
+                "latencyP50": latency.percentile(50), "latencyP99": latency.percentile(99), "latencyMax": latency.max,
+                "hopsP50": hops.percentile(50), "hopsP99": hops.percentile(99), "hopsMax": hops.max}
+
+    # Forget all recorded deliveries
+    def clear(self):
+        self.latency = Histogram()
+        self.hops = Histogram()
+        self.flows = {}
+
+    # Report the network and per flow histograms to a string, naming flows with the given function
+    def reportString(self, name=str):
+        report = "Delivery Latency (ticks): " + self.latency.reportString()
+        report += "Delivery Hops: " + self.hops.reportString()
+
+        for flow, (latency, hops) in self.flows.iteritems():
+            report += "Flow " + name(flow) + " latency " + latency.reportString()
+            report += "Flow " + name(flow) + " hops " + hops.reportString()
+
+        return report
@@ -0,0 +1,84 @@
+################################################################################
+# link.py                                                                      #
+# Class for the one-way links between user nodes on the BATMAN Simulator.      #
+# Each link has a capacity (packets per time step) and a FIFO queue of the     #
+# packets waiting to cross it. Packets are aged lazily when they leave the     #
+# queue: the TTL is reduced by the time spent waiting, and expired packets or  #
+# OGMs superseded by a newer sequence at the sender are discarded without      #
+# using any of the link's capacity. Aggregated frames cross as one packet.     #
+################################################################################
+
+import collections
+
+import memory
+import ogm
+import registry
+
+
+class Link:
+    # Constructor - source and destination are node IDs from the registry
+    def __init__(self, source=0, destination=0, capacity=1):
+        self.source = source
+        self.destination = destination
+        self.capacity = capacity
+
+        # Queue convention: OGMs or packets in arrival order, stamped with queuedAt
+        # The sending user admits packets so its queue limit and drop policy apply
+        self.queue = collections.deque()
+        self.held = memory.newHeld()
+
+        self.delivered = 0
+        self.expired = 0
+
+    # Number of packets waiting on the link
+    def __len__(self):
+        return len(self.queue)
+
+    # Packets waiting on the link, oldest first
+    def packets(self):
+        return list(self.queue)
+
+    # Remove and return up to capacity live packets for delivery in one batch
+    def deliver(self, clock, sender=None):
+        batch = []
+        while len(self.queue) > 0 and len(batch) < self.capacity:
+            packet = self.queue.popleft()
+            memory.hold(self.held, packet, -1)
+
+            # Frames age each of their OGMs and only go stale once all of them have
+            if isinstance(packet, ogm.Frame):
+                known = sender.receivedOGMs if sender is not None else None
+                self.expired += packet.age(clock - packet.queuedAt, known)
+                if len(packet.packets) > 0:
+                    batch.append(packet)
+                continue
+
+            # Age the packet by the time it spent waiting
+            packet.TTL -= clock - packet.queuedAt
+            if packet.TTL <= 0:
+                self.expired += 1
+                continue
+
+            # Drop OGMs the sender already knows a newer sequence for
+            if sender is not None and packet.payload == "" and packet.originator in sender.receivedOGMs:
+                if packet.sequence < sender.receivedOGMs[packet.originator].sequence:
+                    self.expired += 1
+                    continue
+
+            batch.append(packet)
+
+        self.delivered += len(batch)
+        return batch
+
+    # Remove and return every waiting packet
+    def flush(self):
+        batch = self.packets()
+        self.queue.clear()
+        self.held = memory.newHeld()
+        return batch
+
+    # Report the link to a string
+    def reportString(self):
+        return (registry.ip(self.source) + " -> " + registry.ip(self.destination) + " Capacity: " + str(self.capacity) +
+                " Queued: " + str(len(self.queue)) + " Delivered: " + str(self.delivered) +
+                " Expired: " + str(self.expired) + "\n")
@@ -0,0 +1,227 @@
+################################################################################
+# memory.py                                                                    #
+# Memory accounting for the BATMAN Simulator. Counts the items held by each    #
+# structure that grows with a run (the send and receive queues, learned OGMs,  #
+# received messages, lost OGMs, link queues, trace routes, and the route       #
+# timeline) and estimates their bytes from fixed per-item costs measured once, #
+# per node and in aggregate. The counts are kept up to date as packets come    #
+# and go, so a sample only reads them. Samples are taken every few steps as a  #
+# controller listener, and with tracemalloc available (Python 3.4 or the       #
+# pytracemalloc backport) the allocations are attributed by source file too.   #
+################################################################################
+
+import array
+import collections
+import heapq
+import os
+import struct
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import ogm
+import registry
+
+
+NODE_STRUCTURES = ("sendQueue", "receiveQueue", "receivedOGMs", "receivedMessages")
+STRUCTURES = NODE_STRUCTURES + ("lostOGMs", "linkQueues", "traceroutes", "timeline")
+
+# Fixed costs: a pointer, an empty list, and a packet object with its attribute dictionary
+POINTER = struct.calcsize("P")
+LIST_BYTES = sys.getsizeof([])
+PACKET_BYTES = sys.getsizeof(ogm.OGM()) + sys.getsizeof(ogm.OGM().__dict__)
+FRAME_BYTES = sys.getsizeof(ogm.Frame()) + sys.getsizeof(ogm.Frame().__dict__)
+
+# Route timeline costs: an empty array and one of its items
+ARRAY_BYTES = sys.getsizeof(array.array("l"))
+ARRAY_ITEM_BYTES = array.array("l").itemsize
+
+
+# Empty tally convention: <key>structure : <value> [items, approximate bytes]
+def newTally():
+    return dict([(name, [0, 0]) for name in STRUCTURES])
+
+
+# Held counters convention: [packets, approximate bytes, trace route hops], kept up to date by the
+# structure's owner as packets come and go so a sample only has to read them
+def newHeld():
+    return [0, 0, 0]
+
+
+# Count a packet (an OGM, message, or frame of OGMs) into (sign 1) or out of (sign -1) held counters
+# A packet must leave with the trace route and payload it was counted in with
+def hold(held, packet, sign=1):
+    if isinstance(packet, ogm.Frame):
+        size = FRAME_BYTES + LIST_BYTES + POINTER * len(packet.packets)
+        hops = 0
+        for each in packet.packets:
+            hops += len(each.traceroute)
+            size += len(each.payload)
+
+        held[0] += sign * len(packet.packets)
+        held[1] += sign * (size + len(packet.packets) * PACKET_BYTES)
+        held[2] += sign * hops
+    else:
+        held[0] += sign
+        held[1] += sign * (PACKET_BYTES + len(packet.payload))
+        held[2] += sign * len(packet.traceroute)
+
+
+# Add held counters and their container to a structure of a tally
+# Trace route lists are counted apart, as hops, since they grow with the network diameter
+def addHeld(tally, name, held, container):
+    tally[name][0] += held[0]
+    tally[name][1] += held[1] + sys.getsizeof(container)
+    tally["traceroutes"][0] += held[2]
+    tally["traceroutes"][1] += held[0] * LIST_BYTES + held[2] * POINTER
+
+
+# Tally of the structures of one user node
+def measureNode(node, tally=None):
+    if tally is None:
+        tally = newTally()
+
+    addHeld(tally, "sendQueue", node.held["sendQueue"], node.sendQueue)
+    addHeld(tally, "receiveQueue", node.held["receiveQueue"], node.receiveQueue)
+    addHeld(tally, "receivedOGMs", node.held["receivedOGMs"], node.receivedOGMs)
+    addHeld(tally, "receivedMessages", node.held["receivedMessages"], node.receivedMessages)
+    return tally
+
+
+# Total approximate bytes of a tally
+def tallyBytes(tally):
+    return sum([each[1] for each in tally.itervalues()])
+
+
+# Tally of the whole simulation, with the top nodes as (approximate bytes, node ID) pairs
+# Only counters are read, so a sample costs O(nodes + links) however many packets are held
+def measure(controller, top=5):
+    tally = newTally()
+    nodeBytes = []
+
+    for nodeID, node in controller.network.iteritems():
+        before = tallyBytes(tally)
+        measureNode(node, tally)
+        nodeBytes.append((tallyBytes(tally) - before, nodeID))
+
+    addHeld(tally, "lostOGMs", controller.lostHeld, controller.lostOGMs)
+    for key in controller.links:
+        addHeld(tally, "linkQueues", controller.links[key].held, controller.links[key].queue)
+
+    # Each route timeline entry holds a time step array and a next hop array
+    entries = len(controller.timeline.entries)
+    tally["timeline"][0] += controller.timeline.changeTotal
+    tally["timeline"][1] += entries * 2 * ARRAY_BYTES + controller.timeline.changeTotal * 2 * ARRAY_ITEM_BYTES
+
+    return tally, heapq.nlargest(top, nodeBytes)
+
+
+class MemoryAccount:
+    # Constructor - sample every interval time steps, keeping the latest history samples
+    # With trace set (and tracemalloc available) the traced allocations are attributed per source file
+    def __init__(self, controller, interval=100, top=5, history=1000, trace=False):
+        self.controller = controller
+        self.interval = max(interval, 1)
+        self.top = top
+        self.trace = trace and tracemalloc is not None
+        self.running = False
+
+        # Samples convention: (time step, tally, top nodes, traced (file, bytes, blocks) list)
+        self.samples = collections.deque(maxlen=history)
+
+    # Sample with every controller time step that falls on the interval
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        self.controller.memory = self
+        self.controller.addListener(self.update)
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self.controller.removeListener(self.update)
+        if self.trace and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # Controller listener
+    def update(self, clock, hops):
+        if clock % self.interval == 0:
+            self.sample(clock)
+
+    # Take a sample now
+    def sample(self, clock=None):
+        if clock is None:
+            clock = self.controller.clock
+
+        tally, topNodes = measure(self.controller, self.top)
+        self.samples.append((clock, tally, topNodes, self.traced()))
+        return tally
+
+    # Traced allocations per source file of the simulator as (file, bytes, blocks), largest first
+    def traced(self):
+        if not self.trace or not tracemalloc.is_tracing():
+            return []
+
+        here = os.path.dirname(os.path.abspath(__file__))
+        statistics = tracemalloc.take_snapshot().statistics("filename")
+
+        return [(os.path.basename(each.traceback[0].filename), each.size, each.count) for each in statistics
+                if os.path.dirname(os.path.abspath(each.traceback[0].filename)) == here][:self.top]
+
+    # Latest sample (None before the first one)
+    def latest(self):
+        if len(self.samples) == 0:
+            return None
+
+        return self.samples[-1]
+
+    # Tally of one node (IP) measured now
+    def node(self, ip):
+        found = self.controller.findUser(ip)
+        if found is None:
+            return None
+
+        return measureNode(found)
+
+    # Sample history as (time step, structure, items, approximate bytes) rows
+    def rows(self):
+        for clock, tally, topNodes, traced in self.samples:
+            for name in STRUCTURES:
+                yield clock, name, tally[name][0], tally[name][1]
+
+    # Write the sample history as CSV
+    def writeCSV(self, fileName):
+        fileOUT = open(fileName, "w")
+        fileOUT.write("clock,structure,items,bytes\n")
+        for row in self.rows():
+            fileOUT.write(",".join([str(each) for each in row]) + "\n")
+
+        fileOUT.close()
+
+    # Report the latest sample to a string
+    def reportString(self):
+        sample = self.latest()
+        if sample is None:
+            return "Memory: no samples\n"
+
+        clock, tally, topNodes, traced = sample
+        report = "Memory at time " + str(clock) + ": ~" + str(tallyBytes(tally) / 1024) + " KiB accounted\n"
+        for name in STRUCTURES:
+            report += "  %-18s %10d items %10d KiB\n" % (name, tally[name][0], tally[name][1] / 1024)
+
+        for size, nodeID in topNodes:
+            report += "  Node " + registry.ip(nodeID) + ": ~" + str(size / 1024) + " KiB\n"
+
+        for fileName, size, blocks in traced:
+            report += "  Traced " + fileName + ": " + str(size / 1024) + " KiB in " + str(blocks) + " blocks\n"
+
+        return report
@@ -0,0 +1,270 @@
+################################################################################
+# mobility.py                                                                  #
+# Spatial mobility for the BATMAN Simulator. User nodes get positions on a     #
+# plane, a mobility model (static, random waypoint, or random walk), and a     #
+# shared radio range. After every time step the nodes move and the neighbor    #
+# listings are recomputed through a uniform grid of range-sized cells, so a    #
+# node is only compared against the nodes in the 3x3 cells around it. Only     #
+# the radio links that came up or went down are applied to the user nodes.     #
+################################################################################
+
+import collections
+import math
+import random
+
+import registry
+
+
+MODELS = ("static", "waypoint", "walk")
+
+
+class Mobility:
+    # Constructor - the area is width x height, distances per time step use the same units as the radio range
+    def __init__(self, controller, width=1000.0, height=1000.0, radioRange=100.0, seed=None):
+        self.controller = controller
+        self.width = float(width)
+        self.height = float(height)
+        self.radioRange = float(radioRange)
+        self.random = random.Random(seed)
+
+        # Positions convention: <key>node ID : <value> (x, y)
+        self.positions = {}
+
+        # Models convention: <key>node ID : <value> dictionary of the model name and its state
+        # Nodes move in the order they were placed, so the random draws do not depend on the IDs
+        self.models = collections.OrderedDict()
+
+        # Grid convention: <key>(column, row) : <value> set of node IDs, with the cell of each node
+        self.cellSize = max(self.radioRange, 1e-9)
+        self.grid = {}
+        self.cells = {}
+
+        # Radio links convention: <key>node ID : <value> set of node IDs in range
+        self.adjacent = {}
+
+        self.running = False
+        self.linksUp = 0
+        self.linksDown = 0
+
+    # Place a node (IP) at a position (random when not given) with a mobility model
+    def place(self, ip, x=None, y=None, model="waypoint", speed=(1.0, 5.0), pause=0):
+        return self.placeID(registry.intern(ip), x, y, model, speed, pause)
+
+    # Place a node (ID) at a position (random when not given) with a mobility model
+    # Speed is a (minimum, maximum) distance per time step, pause is the waypoint wait in time steps
+    def placeID(self, nodeID, x=None, y=None, model="waypoint", speed=(1.0, 5.0), pause=0):
+        if model not in MODELS:
+            return False
+
+        if x is None:
+            x = self.random.uniform(0.0, self.width)
+        if y is None:
+            y = self.random.uniform(0.0, self.height)
+
+        self.models[nodeID] = {"model": model, "speed": speed, "pause": pause, "wait": 0,
+                               "target": None, "pace": 0.0}
+        self.adjacent.setdefault(nodeID, set())
+        self.move(nodeID, (x, y))
+
+        if self.running:
+            self.relink([nodeID])
+
+        return True
+
+    # Place every node of the network not yet placed at a random position
+    def placeAll(self, model="waypoint", speed=(1.0, 5.0), pause=0):
+        for nodeID in list(self.controller.network):
+            if nodeID not in self.positions:
+                self.placeID(nodeID, model=model, speed=speed, pause=pause)
+
+    # Forget a node and take down its radio links
+    def unplace(self, nodeID):
+        if nodeID not in self.positions:
+            return
+
+        for other in list(self.adjacent.get(nodeID, ())):
+            self.unlink(nodeID, other)
+
+        cell = self.cells.pop(nodeID)
+        self.grid[cell].discard(nodeID)
+        if len(self.grid[cell]) == 0:
+            del self.grid[cell]
+
+        del self.positions[nodeID]
+        del self.models[nodeID]
+        self.adjacent.pop(nodeID, None)
+
+    # Start moving the nodes with every controller time step
+    # Neighbor listings between placed nodes are replaced by the radio links in range
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        for nodeID in self.positions:
+            node = self.controller.network.get(nodeID)
+            if node is not None:
+                self.adjacent[nodeID] = set([each.ID for each in node.neighbors if each.ID in self.positions])
+
+        self.relink(list(self.models))
+        self.controller.addListener(self.step)
+
+    # Stop moving the nodes (the current neighbor listings are kept)
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.controller.removeListener(self.step)
+
+    # Controller listener: move every mobile node and apply the radio links that changed
+    def step(self, clock, hops):
+        for nodeID in [each for each in self.positions if each not in self.controller.network]:
+            self.unplace(nodeID)
+
+        moved = []
+        for nodeID, state in self.models.iteritems():
+            if state["model"] == "waypoint":
+                position = self.waypoint(nodeID, state)
+            elif state["model"] == "walk":
+                position = self.walk(nodeID, state)
+            else:
+                continue
+
+            if position != self.positions[nodeID]:
+                self.move(nodeID, position)
+                moved.append(nodeID)
+
+        self.relink(moved)
+
+    # Random waypoint: head for a random target at a random speed, pausing on arrival
+    def waypoint(self, nodeID, state):
+        x, y = self.positions[nodeID]
+
+        if state["wait"] > 0:
+            state["wait"] -= 1
+            return (x, y)
+
+        if state["target"] is None:
+            state["target"] = (self.random.uniform(0.0, self.width), self.random.uniform(0.0, self.height))
+            state["pace"] = self.random.uniform(state["speed"][0], state["speed"][1])
+
+        targetX, targetY = state["target"]
+        distance = math.hypot(targetX - x, targetY - y)
+        speed = state["pace"]
+
+        if distance <= speed:
+            state["target"] = None
+            state["wait"] = state["pause"]
+            return (targetX, targetY)
+
+        return (x + (targetX - x) * speed / distance, y + (targetY - y) * speed / distance)
+
+    # Random walk: a random heading and speed each time step, reflected at the edges of the area
+    def walk(self, nodeID, state):
+        x, y = self.positions[nodeID]
+
+        heading = self.random.uniform(0.0, 2.0 * math.pi)
+        speed = self.random.uniform(state["speed"][0], state["speed"][1])
+        x += speed * math.cos(heading)
+        y += speed * math.sin(heading)
+
+        if x < 0.0:
+            x = -x
+        elif x > self.width:
+            x = 2.0 * self.width - x
+        if y < 0.0:
+            y = -y
+        elif y > self.height:
+            y = 2.0 * self.height - y
+
+        return (min(max(x, 0.0), self.width), min(max(y, 0.0), self.height))
+
+    # Set a node's position, moving it between grid cells only when it crosses into another one
+    def move(self, nodeID, position):
+        self.positions[nodeID] = position
+        cell = (int(position[0] // self.cellSize), int(position[1] // self.cellSize))
+
+        previous = self.cells.get(nodeID)
+        if previous == cell:
+            return
+
+        if previous is not None:
+            self.grid[previous].discard(nodeID)
+            if len(self.grid[previous]) == 0:
+                del self.grid[previous]
+
+        self.cells[nodeID] = cell
+        self.grid.setdefault(cell, set()).add(nodeID)
+
+    # Node IDs within radio range of a node, searching only the 3x3 cells around it
+    def inRange(self, nodeID):
+        x, y = self.positions[nodeID]
+        column, row = self.cells[nodeID]
+        limit = self.radioRange * self.radioRange
+
+        found = set()
+        for cellX in (column - 1, column, column + 1):
+            for cellY in (row - 1, row, row + 1):
+                for other in self.grid.get((cellX, cellY), ()):
+                    if other == nodeID:
+                        continue
+                    otherX, otherY = self.positions[other]
+                    if (otherX - x) * (otherX - x) + (otherY - y) * (otherY - y) <= limit:
+                        found.add(other)
+
+        return found
+
+    # Recompute the radio links of the given nodes and apply the ones that changed
+    # Links between two nodes that did not move cannot change, so only moved nodes are searched
+    def relink(self, nodeIDs):
+        if not self.running:
+            return
+
+        for nodeID in nodeIDs:
+            current = self.inRange(nodeID)
+            previous = self.adjacent[nodeID]
+
+            for other in sorted(current - previous, key=self.controller.rank):
+                self.link(nodeID, other)
+            for other in sorted(previous - current, key=self.controller.rank):
+                self.unlink(nodeID, other)
+
+    # Bring up the radio link between two nodes (both ways)
+    def link(self, first, second):
+        self.adjacent[first].add(second)
+        self.adjacent[second].add(first)
+
+        network = self.controller.network
+        if first in network and second in network:
+            network[first].addNeighbor(network[second])
+            network[second].addNeighbor(network[first])
+
+        self.linksUp += 1
+
+    # Take down the radio link between two nodes (both ways), losing the packets still crossing it
+    def unlink(self, first, second):
+        self.adjacent[first].discard(second)
+        self.adjacent[second].discard(first)
+
+        network = self.controller.network
+        for source, destination in ((first, second), (second, first)):
+            if source in network and destination in network[source].neighborIndex:
+                network[source].removeNeighbor(network[source].neighborIndex[destination])
+
+        self.controller.cutLink(first, second)
+        self.linksDown += 1
+
+    # Number of radio links currently up
+    def linkCount(self):
+        return sum([len(each) for each in self.adjacent.itervalues()]) / 2
+
+    # Report the node positions and link changes to a string
+    def reportString(self):
+        report = "Mobility: " + str(len(self.positions)) + " nodes, range " + str(self.radioRange) + ", links up " + \
+                 str(self.linkCount()) + " (" + str(self.linksUp) + " came up, " + str(self.linksDown) + " went down)\n"
+
+        for nodeID in sorted(self.positions):
+            x, y = self.positions[nodeID]
+            report += registry.ip(nodeID) + " " + self.models[nodeID]["model"] + " (" + str(round(x, 1)) + ", " + \
+                      str(round(y, 1)) + ")\n"
+
+        return report
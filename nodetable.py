@@ -0,0 +1,97 @@
+################################################################################
+# nodetable.py                                                                 #
+# Node table of the BATMAN Simulator GUI. Lists every user node with its OGM   #
+# interval, neighbor count, route count, and sequence, however large the       #
+# network is. Only the rows in view are ever rendered: the listbox holds one   #
+# page of rows, and scrolling swaps in the rows for the new position. Picking  #
+# a row hands the node to the editor panel.                                    #
+################################################################################
+
+from Tkinter import *
+
+
+class NodeTable:
+    # Constructor - onSelect is called with the user node of a picked row
+    def __init__(self, parent, controller, onSelect=None, rows=10, width=60):
+        self.controller = controller
+        self.onSelect = onSelect
+        self.rows = rows
+
+        # Node IDs in table order (the rendered rows are a window of it starting at top)
+        self.order = []
+        self.top = 0
+
+        self.frame = Frame(parent)
+        self.title = Label(self.frame, text="", anchor=W, width=width)
+        self.listbox = Listbox(self.frame, height=rows, width=width, font="TkFixedFont", activestyle="none",
+                               exportselection=False)
+        self.scrollbar = Scrollbar(self.frame, command=self.scroll)
+
+        self.title.grid(row=0, column=0, columnspan=2, sticky=W)
+        self.listbox.grid(row=1, column=0)
+        self.scrollbar.grid(row=1, column=1, sticky=N+S)
+
+        self.listbox.bind("<<ListboxSelect>>", self.select)
+        self.listbox.bind("<MouseWheel>", self.wheel)
+        self.listbox.bind("<Button-4>", self.wheel)
+        self.listbox.bind("<Button-5>", self.wheel)
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    # Pick up nodes added or removed since the last refresh and render the rows in view
+    def refresh(self):
+        self.order = self.controller.network.keys()
+        self.top = max(min(self.top, len(self.order) - self.rows), 0)
+        self.render()
+
+    # Render the rows in view and move the scrollbar to match
+    def render(self):
+        network = self.controller.network
+        self.listbox.delete(0, END)
+
+        for nodeID in self.order[self.top:self.top + self.rows]:
+            node = network.get(nodeID)
+            if node is not None:
+                self.listbox.insert(END, self.rowString(node))
+            else:
+                self.listbox.insert(END, "(removed)")
+
+        self.title.config(text="Nodes: " + str(len(self.order)) + "   IP / interval / neighbors / routes / sequence")
+
+        total = max(len(self.order), 1)
+        self.scrollbar.set(float(self.top) / total, float(min(self.top + self.rows, total)) / total)
+
+    def rowString(self, node):
+        return "%-18s %5d %5d %6d %7d" % (node.IP, node.broadcastTime, len(node.neighbors), len(node.receivedOGMs),
+                                          node.sequence)
+
+    # Scrollbar command: "moveto" a fraction, or "scroll" a number of units (rows) or pages
+    def scroll(self, action, amount, units=None):
+        if action == "moveto":
+            top = int(float(amount) * len(self.order))
+        elif units == "pages":
+            top = self.top + int(amount) * self.rows
+        else:
+            top = self.top + int(amount)
+
+        top = max(min(top, len(self.order) - self.rows), 0)
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll("scroll", -3, "units")
+        else:
+            self.scroll("scroll", 3, "units")
+
+    # Hand the node of the picked row to the editor
+    def select(self, event):
+        picked = self.listbox.curselection()
+        if len(picked) == 0 or self.onSelect is None:
+            return
+
+        index = self.top + int(picked[0])
+        if index < len(self.order) and self.order[index] in self.controller.network:
+            self.onSelect(self.controller.network[self.order[index]])
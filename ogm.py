@@ -13,30 +13,60 @@
 
 import copy
 
+import registry
 
-class OGM:
-    # Constructor
-    def __init__(self, origIP="0.0.0.0", sendIP="0.0.0.0", nextHop="0.0.0.0", seq=0,
-                 ttl=300, direction=False, destIP="", message=""):
-        self.originatorIP = origIP
-        self.senderIP = sendIP
+
+class OGM(object):
+    # Constructor - originator, sender, next hop, and destination are node IDs from the registry
+    def __init__(self, origin=0, sender=0, nextHop=None, seq=0,
+                 ttl=300, direction=False, dest=None, message="", tick=0):
+        self.originator = origin
+        self.sender = sender
         self.nextHop = nextHop
         self.sequence = seq
         self.TTL = ttl
         self.directional = direction
-        self.traceroute = [self.senderIP]
-        self.destinationIP = destIP
+        self.traceroute = [self.sender]
+        self.destination = dest
         self.payload = message
 
-    # Copy method
+        # Data packets carry the time step they were injected and the flow they belong to
+        self.injectTick = tick
+        self.flow = None
+
+        # Time step the packet entered its current link queue, and the node that last transmitted it
+        # (known to the receiving link, None when it was not delivered over one)
+        self.queuedAt = 0
+        self.transmitter = None
+
+    # IP addresses of the node IDs, for reporting
+    @property
+    def originatorIP(self):
+        return registry.ip(self.originator)
+
+    @property
+    def senderIP(self):
+        return registry.ip(self.sender)
+
+    @property
+    def nextHopIP(self):
+        return registry.ip(self.nextHop)
+
+    @property
+    def destinationIP(self):
+        return registry.ip(self.destination)
+
+    # Copy method (only the trace route is mutable, everything else is shared)
     def copy(self):
-        return copy.deepcopy(self)
+        duplicate = copy.copy(self)
+        duplicate.traceroute = list(self.traceroute)
+        return duplicate
 
     # Report the OGM to a string
     def reportString(self):
         oIP = "Originator IP: " + str(self.originatorIP) + "\n"
         sendIP = "Sender IP: " + str(self.senderIP) + "\n"
-        nHop = "Next hop: " + str(self.nextHop) + "\n"
+        nHop = "Next hop: " + str(self.nextHopIP) + "\n"
         seq = "Sequence Number: " + str(self.sequence) + "\n"
         ttl = "TTL: " + str(self.TTL) + "\n"
         direction = "Uni-Directional? " + str(self.directional) + "\n"
@@ -44,9 +74,66 @@ class OGM:
 
         trace = "Trace Route:\n"
         for each in self.traceroute:
-            trace += str(each) + " "
+            trace += str(registry.ip(each)) + " "
         trace += "\n"
 
         payload = "Data: " + str(self.payload) + "\n\n"
 
         return oIP + sendIP + nHop + seq + ttl + direction + destIP + trace + payload
+
+
+class Frame(object):
+    # Constructor - an aggregated frame of the OGMs a sender has for the same next hop in one time step
+    def __init__(self, sender=0, nextHop=None, packets=None):
+        self.sender = sender
+        self.originator = sender
+        self.nextHop = nextHop
+        self.packets = packets if packets is not None else []
+        self.payload = ""
+        self.directional = False
+        self.queuedAt = 0
+
+        # The frame lives as long as its longest-lived OGM and sorts by its newest sequence
+        self.sequence = max([each.sequence for each in self.packets] + [0])
+        self.TTL = max([each.TTL for each in self.packets] + [0])
+
+    # IP addresses of the node IDs, for reporting
+    @property
+    def originatorIP(self):
+        return registry.ip(self.originator)
+
+    @property
+    def senderIP(self):
+        return registry.ip(self.sender)
+
+    @property
+    def nextHopIP(self):
+        return registry.ip(self.nextHop)
+
+    # Age the contained OGMs, dropping the ones that expired or that the sender knows a newer sequence for
+    # Returns the number of OGMs dropped
+    def age(self, deltaTime, known=None):
+        live = []
+        for each in self.packets:
+            each.TTL -= deltaTime
+            if each.TTL <= 0:
+                continue
+            if known is not None and each.originator in known:
+                if each.sequence < known[each.originator].sequence:
+                    continue
+            live.append(each)
+
+        dropped = len(self.packets) - len(live)
+        self.packets = live
+        self.TTL = max([each.TTL for each in self.packets] + [0])
+        return dropped
+
+    # Report the frame and its OGMs to a string
+    def reportString(self):
+        header = "Frame Sender IP: " + str(self.senderIP) + " Next hop: " + str(self.nextHopIP) + " OGMs: " + \
+                 str(len(self.packets)) + "\n"
+
+        for each in self.packets:
+            header += each.reportString()
+
+        return header
@@ -0,0 +1,69 @@
+################################################################################
+# registry.py                                                                  #
+# Node registry for the BATMAN Simulator. Every IP address is interned once    #
+# to a dense integer ID, and the controller, user nodes, OGMs, and links work  #
+# on those IDs internally so keys hash and compare as small integers. IPs are  #
+# only looked up again at the reporting and GUI boundary. IDs are never        #
+# reused, so one registry is shared by every simulation in the process, unless #
+# a long-running host (the simulation server) gives each simulation its own    #
+# and switches to it, letting a dropped simulation's IPs go with it.           #
+################################################################################
+
+
+class NodeRegistry:
+    # Constructor
+    def __init__(self):
+        # IDs convention: <key>IP : <value> ID, with IPs indexed by ID
+        self.ids = {}
+        self.ips = []
+
+    # Return the ID of an IP, assigning the next free ID the first time it is seen
+    def intern(self, ip):
+        if ip not in self.ids:
+            self.ids[ip] = len(self.ips)
+            self.ips.append(ip)
+
+        return self.ids[ip]
+
+    # Return the ID of an IP already interned (None otherwise)
+    def find(self, ip):
+        return self.ids.get(ip)
+
+    # Return the IP of an ID ("" for no node)
+    def ip(self, nodeID):
+        if nodeID is None:
+            return ""
+
+        return self.ips[nodeID]
+
+    # Number of IPs interned
+    def __len__(self):
+        return len(self.ips)
+
+
+# The registry shared by the simulator modules
+nodes = NodeRegistry()
+
+
+# Make a registry the shared one, returning the registry it replaces
+def use(registry):
+    global nodes
+
+    previous = nodes
+    nodes = registry
+    return previous
+
+
+# Intern an IP in the shared registry
+def intern(ip):
+    return nodes.intern(ip)
+
+
+# Find an interned IP in the shared registry
+def find(ip):
+    return nodes.find(ip)
+
+
+# Look up the IP of an ID in the shared registry
+def ip(nodeID):
+    return nodes.ip(nodeID)
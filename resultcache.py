@@ -0,0 +1,167 @@
+################################################################################
+# resultcache.py                                                               #
+# Content-addressed result cache for the BATMAN Simulator. A run is keyed by   #
+# the SHA-256 hash of its canonical definition (the scenario events in the     #
+# order they apply, the topology file contents, the run length, the options)   #
+# together with a hash of the simulator source, so a changed configuration or  #
+# a changed simulator never reuses an old result. Each entry is a directory of #
+# the run summary and its metrics files, and the least recently used entries   #
+# are evicted once the cache grows past its size limit.                        #
+################################################################################
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+CACHE_DIRECTORY = ".batmancache"
+SUMMARY_FILE = "summary.json"
+
+# Hash of the simulator source, computed once per process
+sourceHash = None
+
+
+# Hash of every simulator module, standing in for the simulator version
+def simulatorVersion():
+    global sourceHash
+
+    if sourceHash is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for fileName in sorted(glob.glob(os.path.join(here, "*.py"))):
+            digest.update(os.path.basename(fileName) + "\0")
+            fileIN = open(fileName, "rb")
+            digest.update(fileIN.read())
+            fileIN.close()
+
+        sourceHash = digest.hexdigest()
+
+    return sourceHash
+
+
+# Hash of a file's contents (None for no file)
+def fileHash(fileName):
+    if fileName is None:
+        return None
+
+    digest = hashlib.sha256()
+    fileIN = open(fileName, "rb")
+    for block in iter(lambda: fileIN.read(1 << 20), ""):
+        digest.update(block)
+    fileIN.close()
+
+    return digest.hexdigest()
+
+
+# Cache key of a run: the scenario (a Scenario or its lines), the topology file, the run length, and options
+def runKey(scenarioLines, ticks, topologyFile=None, options=None):
+    if hasattr(scenarioLines, "lines"):
+        scenarioLines = scenarioLines.lines()
+
+    digest = hashlib.sha256()
+    digest.update("version " + simulatorVersion() + "\n")
+    digest.update("ticks " + str(ticks) + "\n")
+    digest.update("topology " + str(fileHash(topologyFile)) + "\n")
+    digest.update("options " + json.dumps(options or {}, sort_keys=True, separators=(",", ":")) + "\n")
+    for line in scenarioLines:
+        digest.update(line)
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Constructor - entries past maxBytes in total are evicted, least recently used first
+    def __init__(self, directory=CACHE_DIRECTORY, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    # Cached summary and metrics file paths of a key as (summary, <key>name : <value> path), None on a miss
+    def get(self, key):
+        entry = self.path(key)
+        try:
+            fileIN = open(os.path.join(entry, SUMMARY_FILE), "r")
+            summary = json.load(fileIN)
+            fileIN.close()
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+
+        # Mark the entry as used for the eviction order
+        os.utime(entry, None)
+        self.hits += 1
+
+        files = dict([(name, os.path.join(entry, name)) for name in os.listdir(entry) if name != SUMMARY_FILE])
+        return summary, files
+
+    # Store a run summary with the metrics files given as <key>name : <value> path to copy in
+    # The entry is written aside and renamed into place, so readers never see a partial one
+    def put(self, key, summary, files=None):
+        staging = tempfile.mkdtemp(prefix=".staging_", dir=self.directory)
+        try:
+            fileOUT = open(os.path.join(staging, SUMMARY_FILE), "w")
+            json.dump(summary, fileOUT, sort_keys=True)
+            fileOUT.close()
+
+            for name, source in (files or {}).iteritems():
+                shutil.copyfile(source, os.path.join(staging, os.path.basename(name)))
+
+            if os.path.isdir(self.path(key)):
+                shutil.rmtree(self.path(key))
+            os.rename(staging, self.path(key))
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging)
+
+        self.evict()
+
+    # Entries as (last used time, bytes, key), least recently used first
+    def entries(self):
+        found = []
+        for key in os.listdir(self.directory):
+            entry = self.path(key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+
+            size = sum([os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry)])
+            found.append((os.path.getmtime(entry), size, key))
+
+        found.sort()
+        return found
+
+    # Evict the least recently used entries until the cache fits its size limit
+    def evict(self):
+        found = self.entries()
+        total = sum([size for used, size, key in found])
+
+        for used, size, key in found:
+            if total <= self.maxBytes:
+                break
+
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    # Remove every entry
+    def clear(self):
+        for used, size, key in self.entries():
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    # Report the cache use to a string
+    def reportString(self):
+        found = self.entries()
+        return "Result Cache " + self.directory + ": " + str(len(found)) + " entries, " + \
+               str(sum([size for used, size, key in found]) / 1024) + " KiB of " + str(self.maxBytes / 1024) + \
+               " KiB, " + str(self.hits) + " hits, " + str(self.misses) + " misses, " + str(self.evictions) + \
+               " evicted\n"
@@ -0,0 +1,111 @@
+################################################################################
+# runner.py                                                                    #
+# Headless runner for the BATMAN Simulator. Runs a scenario file (optionally   #
+# on an imported topology) for a number of time steps without the GUI and      #
+# returns the run summary with its metrics files. Results go through the       #
+# content-addressed result cache, so a configuration that was run before with  #
+# the same simulator source returns at once and only changed ones simulate.    #
+#                                                                              #
+# Usage: python runner.py <scenario file> <ticks> [topology file]              #
+################################################################################
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import controller
+import memory
+import resultcache
+import scenario
+import topology
+
+
+# Run options convention: "sample" originators tracked (with "seed" and "track" IPs under study)
+# for sampled mode, and "memoryInterval" time steps between memory samples (None for no accounting)
+OPTIONS = ("sample", "seed", "track", "memoryInterval")
+
+# Seed of a sampled run given none, so every run of a configuration draws the same sample
+SAMPLE_SEED = 0
+
+
+# Run a scenario headless, returning (summary, <key>name : <value> metrics file path, cached)
+# With a cache the metrics files live in the cache entry, otherwise in a new directory the caller owns
+def run(scenarioFile=None, ticks=100, topologyFile=None, options=None, cache=None):
+    options = dict(options or {})
+    for name in options:
+        if name not in OPTIONS:
+            raise ValueError("Unknown run option " + name)
+
+    # The seed is set before the cache key is taken, so a cached result is the one the key describes
+    if options.get("sample") and options.get("seed") is None:
+        options["seed"] = SAMPLE_SEED
+
+    loaded = scenario.load(scenarioFile) if scenarioFile is not None else scenario.Scenario()
+
+    key = None
+    if cache is not None:
+        key = resultcache.runKey(loaded, ticks, topologyFile, options)
+        found = cache.get(key)
+        if found is not None:
+            return found[0], found[1], True
+
+    simulation = controller.Controller()
+    if topologyFile is not None:
+        topology.load(simulation, topologyFile)
+    simulation.loadScenario(loaded)
+
+    if options.get("memoryInterval"):
+        memory.MemoryAccount(simulation, interval=options["memoryInterval"]).start()
+
+    if options.get("sample") or options.get("track"):
+        # Nodes joining at the start are in place before the sample is drawn
+        loaded.apply(simulation)
+        simulation.sampleOriginators(options.get("sample", 0), options.get("track", ()), options.get("seed"))
+
+    simulation.tick(ticks)
+    summary = simulation.summary()
+
+    # Metrics files of the run
+    workspace = tempfile.mkdtemp(prefix="batmanrun_")
+    files = {"report.txt": os.path.join(workspace, "report.txt")}
+    fileOUT = open(files["report.txt"], "w")
+    fileOUT.write(simulation.reportString())
+    fileOUT.close()
+
+    if simulation.memory is not None:
+        files["memory.csv"] = os.path.join(workspace, "memory.csv")
+        simulation.memory.writeCSV(files["memory.csv"])
+
+    if cache is None:
+        return summary, files, False
+
+    cache.put(key, summary, files)
+    shutil.rmtree(workspace, ignore_errors=True)
+
+    # An entry larger than the whole cache is evicted at once, leaving no files
+    entry = cache.path(key)
+    return summary, dict([(name, os.path.join(entry, name)) for name in files
+                          if os.path.isfile(os.path.join(entry, name))]), False
+
+
+# Run a sweep of (scenario file, ticks, topology file, options) configurations through one cache
+def sweep(configurations, cache=None):
+    if cache is None:
+        cache = resultcache.ResultCache()
+
+    return [run(scenarioFile, ticks, topologyFile, options, cache)
+            for scenarioFile, ticks, topologyFile, options in configurations]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print "Usage: python runner.py <scenario file> <ticks> [topology file]"
+        sys.exit(1)
+
+    cache = resultcache.ResultCache()
+    summary, files, cached = run(sys.argv[1], int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None,
+                                 cache=cache)
+
+    print json.dumps({"summary": summary, "files": files, "cached": cached}, sort_keys=True, indent=2)
@@ -0,0 +1,214 @@
+################################################################################
+# scenario.py                                                                  #
+# Scenario timelines for the BATMAN Simulator. A scenario is a queue of        #
+# events (node join and leave, link up and down, spoof start and stop, and     #
+# message injection) kept sorted by time step. Loaded into the controller, the #
+# events that fall due are applied at the start of each step, so scripted      #
+# churn runs in one uninterrupted run instead of stop-and-restart cycles.      #
+#                                                                              #
+# Scenario files have one event per line: <time step> <event> <arguments>      #
+#   join <IP> [<OGM interval> [uni] [<neighbor IP> ...]]                       #
+#   leave <IP>                                                                 #
+#   linkup <IP> <IP>            linkdown <IP> <IP>                             #
+#   spoofstart <IP> <spoofed IP>    spoofstop <IP>                             #
+#   message <sender IP> <destination IP> <TTL> <data ...>                      #
+################################################################################
+
+import heapq
+
+import user
+
+
+EVENTS = ("join", "leave", "linkup", "linkdown", "spoofstart", "spoofstop", "message")
+
+
+class Scenario:
+    # Constructor
+    def __init__(self):
+        # Events convention: heap of (time step, insertion order, event, argument tuple)
+        # The insertion order keeps events of the same time step in the order they were added
+        self.events = []
+        self.order = 0
+
+        self.applied = 0
+        self.failed = 0
+
+    # Add an event at a time step (False for an unknown event)
+    def add(self, clock, event, *args):
+        if event not in EVENTS:
+            return False
+
+        heapq.heappush(self.events, (clock, self.order, event, args))
+        self.order += 1
+        return True
+
+    # Add a node joining with links to the given neighbor IPs
+    def join(self, clock, ip, castTime=1, direction=False, neighbors=()):
+        return self.add(clock, "join", ip, castTime, direction, tuple(neighbors))
+
+    def leave(self, clock, ip):
+        return self.add(clock, "leave", ip)
+
+    def linkUp(self, clock, first, second):
+        return self.add(clock, "linkup", first, second)
+
+    def linkDown(self, clock, first, second):
+        return self.add(clock, "linkdown", first, second)
+
+    def spoofStart(self, clock, attacker, victim):
+        return self.add(clock, "spoofstart", attacker, victim)
+
+    def spoofStop(self, clock, attacker):
+        return self.add(clock, "spoofstop", attacker)
+
+    # A message needs data, since a packet with an empty payload is taken for a routing OGM
+    def message(self, clock, sender, destination, ttl, data):
+        return self.add(clock, "message", sender, destination, ttl, data)
+
+    # Number of events not applied yet
+    def __len__(self):
+        return len(self.events)
+
+    # Time step of the next event (None when there are no more)
+    def nextTick(self):
+        if len(self.events) == 0:
+            return None
+
+        return self.events[0][0]
+
+    # Apply every event due by the controller's clock, in time step order
+    def apply(self, controller):
+        while len(self.events) > 0 and self.events[0][0] <= controller.clock:
+            clock, order, event, args = heapq.heappop(self.events)
+
+            if getattr(self, "apply" + event.capitalize())(controller, *args):
+                self.applied += 1
+            else:
+                self.failed += 1
+
+    def applyJoin(self, controller, ip, castTime=1, direction=False, neighbors=()):
+        newUser = user.User(ip=ip, castTime=castTime, direction=direction)
+        for each in neighbors:
+            neighbor = controller.findUser(each)
+            if neighbor is not None:
+                newUser.addNeighbor(neighbor)
+                neighbor.addNeighbor(newUser)
+
+        return controller.addUser(newUser)
+
+    def applyLeave(self, controller, ip):
+        return controller.removeUser(controller.findUser(ip))
+
+    def applyLinkup(self, controller, first, second):
+        firstUser = controller.findUser(first)
+        secondUser = controller.findUser(second)
+        if firstUser is None or secondUser is None:
+            return False
+
+        firstUser.addNeighbor(secondUser)
+        secondUser.addNeighbor(firstUser)
+        return True
+
+    def applyLinkdown(self, controller, first, second):
+        firstUser = controller.findUser(first)
+        secondUser = controller.findUser(second)
+        if firstUser is None or secondUser is None:
+            return False
+
+        firstUser.removeNeighbor(secondUser)
+        secondUser.removeNeighbor(firstUser)
+        controller.cutLink(firstUser.ID, secondUser.ID)
+        return True
+
+    def applySpoofstart(self, controller, attacker, victim):
+        attackerUser = controller.findUser(attacker)
+        if attackerUser is None:
+            return False
+
+        attackerUser.spoofAs(victim)
+        return True
+
+    def applySpoofstop(self, controller, attacker):
+        attackerUser = controller.findUser(attacker)
+        if attackerUser is None:
+            return False
+
+        attackerUser.spoofAs("")
+        return True
+
+    def applyMessage(self, controller, sender, destination, ttl, data):
+        senderUser = controller.findUser(sender)
+        if senderUser is None or data == "":
+            return False
+
+        return senderUser.sendMessage(destination=destination, ttl=ttl, data=data) is not None
+
+    # Pending events as scenario file lines, in the order they will be applied
+    def lines(self):
+        for clock, order, event, args in sorted(self.events):
+            if event == "join":
+                ip, castTime, direction, neighbors = args
+                args = (ip, castTime) + (("uni",) if direction else ()) + tuple(neighbors)
+
+            yield str(clock) + " " + event + " " + " ".join([str(each) for each in args]) + "\n"
+
+    # Write the pending events to a scenario file
+    def save(self, fileName):
+        fileOUT = open(fileName, "w")
+        fileOUT.writelines(self.lines())
+        fileOUT.close()
+
+    # Report the scenario progress to a string
+    def reportString(self):
+        return "Scenario: " + str(self.applied) + " events applied, " + str(self.failed) + " failed, " + \
+               str(len(self.events)) + " pending (next at " + str(self.nextTick()) + ")\n"
+
+
+# Parse scenario lines (blank lines and # comments are skipped), raising ValueError on a bad line
+def parse(lines):
+    scenario = Scenario()
+
+    for number, line in enumerate(lines):
+        fields = line.split("#", 1)[0].split()
+        if len(fields) == 0:
+            continue
+
+        try:
+            clock = int(fields[0])
+            event = fields[1].lower()
+            args = fields[2:]
+
+            if event == "join":
+                castTime = int(args[1]) if len(args) > 1 else 1
+                direction = len(args) > 2 and args[2] == "uni"
+                neighbors = args[3:] if direction else args[2:]
+                scenario.join(clock, args[0], castTime, direction, neighbors)
+            elif event == "leave":
+                scenario.leave(clock, args[0])
+            elif event == "linkup":
+                scenario.linkUp(clock, args[0], args[1])
+            elif event == "linkdown":
+                scenario.linkDown(clock, args[0], args[1])
+            elif event == "spoofstart":
+                scenario.spoofStart(clock, args[0], args[1])
+            elif event == "spoofstop":
+                scenario.spoofStop(clock, args[0])
+            elif event == "message":
+                if len(args) < 4:
+                    raise ValueError("message without data")
+                scenario.message(clock, args[0], args[1], int(args[2]), " ".join(args[3:]))
+            else:
+                raise ValueError("unknown event " + event)
+        except (IndexError, ValueError) as error:
+            raise ValueError("Scenario line " + str(number + 1) + ": " + line.strip() + " (" + str(error) + ")")
+
+    return scenario
+
+
+# Load a scenario file
+def load(fileName):
+    fileIN = open(fileName, "r")
+    try:
+        return parse(fileIN)
+    finally:
+        fileIN.close()
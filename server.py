@@ -0,0 +1,320 @@
+################################################################################
+# server.py                                                                    #
+# Simulation server for the BATMAN Simulator. A long-running daemon keeps one  #
+# or more named controllers resident and answers batches of commands sent      #
+# over a local Unix socket: nodes joining and leaving, links up and down,      #
+# spoofing, messages, running time steps, and querying metrics and routes.     #
+# Every request and response is a frame of a 4-byte length and compact JSON,   #
+# so scripts drive many small experiments against a warm simulator without     #
+# paying process startup or network construction each time.                    #
+#                                                                              #
+# Request:  {"sim": <name>, "commands": [[<command>, <argument>, ...], ...]}   #
+# Response: {"results": [<result or {"error": <message>}>, ...]}               #
+#                                                                              #
+# Usage: python server.py [socket path]                                        #
+################################################################################
+
+import json
+import os
+import socket
+import SocketServer
+import struct
+import sys
+import threading
+
+import controller
+import registry
+import scenario
+import topology
+
+
+SOCKET_PATH = "/tmp/batmansim.sock"
+
+# Frame header: payload length, and the largest payload accepted
+FRAME = struct.Struct("!I")
+FRAME_LIMIT = 64 * 1024 * 1024
+
+# Commands applied through the scenario events of the same name, as <key>command : <value> argument count
+EVENT_COMMANDS = {"join": 4, "leave": 1, "linkup": 2, "linkdown": 2, "spoofstart": 2, "spoofstop": 1, "message": 4}
+
+
+# A JSON string argument as the str a scenario file gives
+def text(value):
+    if not isinstance(value, basestring):
+        raise ValueError("expected a string, got " + json.dumps(value))
+
+    return str(value)
+
+
+# A JSON number (or numeric string) argument as an int of at least least
+def integer(value, least):
+    if isinstance(value, bool) or not isinstance(value, (int, long, basestring)):
+        raise ValueError("expected an integer, got " + json.dumps(value))
+
+    value = int(value)
+    if value < least:
+        raise ValueError("expected an integer of at least " + str(least) + ", got " + str(value))
+
+    return value
+
+
+# Arguments of an event command coerced to the types a scenario file gives the event, raising ValueError on bad ones
+def eventArguments(command, args):
+    if len(args) > EVENT_COMMANDS[command]:
+        raise ValueError("takes at most " + str(EVENT_COMMANDS[command]) + " arguments")
+
+    if command == "join":
+        if len(args) < 1:
+            raise ValueError("takes an IP")
+
+        coerced = [text(args[0])]
+        if len(args) > 1:
+            coerced.append(integer(args[1], 1))
+        if len(args) > 2:
+            if not isinstance(args[2], bool):
+                raise ValueError("expected true or false for the direction, got " + json.dumps(args[2]))
+            coerced.append(args[2])
+        if len(args) > 3:
+            if not isinstance(args[3], list):
+                raise ValueError("expected a list of neighbor IPs, got " + json.dumps(args[3]))
+            coerced.append(tuple([text(each) for each in args[3]]))
+
+        return coerced
+
+    if len(args) < EVENT_COMMANDS[command]:
+        raise ValueError("takes " + str(EVENT_COMMANDS[command]) + " arguments")
+
+    # A message with empty data would be taken for a routing OGM
+    if command == "message":
+        if text(args[3]) == "":
+            raise ValueError("empty data")
+        return [text(args[0]), text(args[1]), integer(args[2], 1), text(args[3])]
+
+    return [text(each) for each in args]
+
+
+# Read exactly size bytes from a socket (None if it closes first)
+def receiveExactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return "".join(chunks)
+
+
+# Read one frame as a decoded object (None when the connection closes)
+def receiveFrame(connection):
+    header = receiveExactly(connection, FRAME.size)
+    if header is None:
+        return None
+
+    size = FRAME.unpack(header)[0]
+    if size > FRAME_LIMIT:
+        raise ValueError("Frame of " + str(size) + " bytes is over the limit")
+
+    payload = receiveExactly(connection, size)
+    if payload is None:
+        return None
+
+    return json.loads(payload)
+
+
+# Send an object as one frame
+def sendFrame(connection, value):
+    payload = json.dumps(value, separators=(",", ":"))
+    connection.sendall(FRAME.pack(len(payload)) + payload)
+
+
+class Simulations:
+    # Constructor
+    def __init__(self):
+        # Simulations convention: <key>name : <value> Controller, with each simulation's own node registry
+        # so the IPs of a dropped or cleared simulation are freed with it
+        self.controllers = {}
+        self.registries = {}
+        self.events = scenario.Scenario()
+
+        # Commands from concurrent connections run one batch at a time
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.commands = 0
+
+    # Run a batch of commands against a simulation, one result per command
+    def batch(self, name, commands):
+        results = []
+        with self.lock:
+            self.batches += 1
+            previous = registry.nodes
+            try:
+                for command in commands:
+                    self.commands += 1
+                    try:
+                        results.append(self.run(name, command[0], command[1:]))
+                    except Exception as error:
+                        results.append({"error": str(command[0]) + ": " + str(error)})
+            finally:
+                registry.use(previous)
+
+        return results
+
+    # Create a simulation with its own node registry
+    def create(self, name):
+        self.controllers[name] = controller.Controller()
+        self.registries[name] = registry.NodeRegistry()
+
+    # The named simulation, created on first use, with its node registry made the shared one
+    def simulation(self, name):
+        if name not in self.controllers:
+            self.create(name)
+
+        registry.use(self.registries[name])
+        return self.controllers[name]
+
+    # Run one command, raising an error for a bad one
+    def run(self, name, command, args):
+        if command in EVENT_COMMANDS:
+            args = eventArguments(command, args)
+            return getattr(self.events, "apply" + command.capitalize())(self.simulation(name), *args)
+
+        if command == "create":
+            self.create(name)
+            return name
+        if command == "drop":
+            self.registries.pop(name, None)
+            return self.controllers.pop(name, None) is not None
+        if command == "list":
+            return sorted(self.controllers)
+        if command == "status":
+            return {"simulations": len(self.controllers), "batches": self.batches, "commands": self.commands}
+
+        simulation = self.simulation(name)
+        if command == "tick":
+            simulation.tick(int(args[0]) if len(args) > 0 else 1)
+            return simulation.clock
+        if command == "summary":
+            return simulation.summary()
+        if command == "clear":
+            simulation.clear()
+
+            # Link capacities are kept by node ID, and the fresh registry numbers the nodes anew
+            simulation.capacities = {}
+            self.registries[name] = registry.NodeRegistry()
+            return True
+        if command == "nodes":
+            return [simulation.network[nodeID].IP for nodeID in simulation.network]
+        if command == "routes":
+            return self.routes(simulation, args[0])
+        if command == "messages":
+            return self.messages(simulation, args[0])
+        if command == "scenario":
+            loaded = scenario.parse(args[0].splitlines())
+            simulation.loadScenario(loaded)
+            return len(loaded)
+        if command == "import":
+            imported = topology.load(simulation, args[0], args[1] if len(args) > 1 else None)
+            return {"nodes": imported.nodes, "links": imported.links}
+        if command == "export":
+            topology.save(simulation, args[0], args[1] if len(args) > 1 else None)
+            return len(simulation.network)
+
+        raise ValueError("unknown command")
+
+    # Routes of a node as <key>originator IP : <value> next hop IP
+    def routes(self, simulation, ip):
+        node = simulation.findUser(ip)
+        if node is None:
+            raise ValueError("no node " + str(ip))
+
+        return dict([(registry.ip(originator), registry.ip(packet.sender))
+                     for originator, packet in node.receivedOGMs.iteritems()])
+
+    # Messages a node received as <key>sender IP : <value> payload
+    def messages(self, simulation, ip):
+        node = simulation.findUser(ip)
+        if node is None:
+            raise ValueError("no node " + str(ip))
+
+        return dict([(registry.ip(originator), packet.payload)
+                     for originator, packet in node.receivedMessages.iteritems()])
+
+
+class BatchHandler(SocketServer.BaseRequestHandler):
+    # Answer request frames on one connection until the client closes it
+    def handle(self):
+        while True:
+            try:
+                request = receiveFrame(self.request)
+                if request is None:
+                    return
+
+                results = self.server.simulations.batch(request.get("sim", "default"), request.get("commands", []))
+                sendFrame(self.request, {"results": results})
+            except (ValueError, AttributeError, TypeError) as error:
+                sendFrame(self.request, {"error": "bad request: " + str(error)})
+                return
+            except socket.error:
+                return
+
+
+class SimulationServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    # Constructor - a stale socket file left by an earlier server is replaced
+    def __init__(self, path=SOCKET_PATH):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        SocketServer.UnixStreamServer.__init__(self, path, BatchHandler)
+        self.path = path
+        self.simulations = Simulations()
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class Client:
+    # Constructor - connects to a running server
+    def __init__(self, path=SOCKET_PATH, sim="default"):
+        self.sim = sim
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(path)
+
+    # Send a batch of [command, argument, ...] lists and return their results
+    def batch(self, commands, sim=None):
+        sendFrame(self.connection, {"sim": sim or self.sim, "commands": commands})
+        response = receiveFrame(self.connection)
+        if response is None:
+            raise IOError("Simulation server closed the connection")
+        if "error" in response:
+            raise ValueError(response["error"])
+
+        return response["results"]
+
+    # Send a single command and return its result
+    def call(self, command, *args):
+        result = self.batch([[command] + list(args)])[0]
+        if isinstance(result, dict) and "error" in result and len(result) == 1:
+            raise ValueError(result["error"])
+
+        return result
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    server = SimulationServer(sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH)
+    print "BATMAN simulation server listening on " + server.path
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
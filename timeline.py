@@ -0,0 +1,150 @@
+################################################################################
+# timeline.py                                                                  #
+# Route-learning timeline for the BATMAN Simulator. Every change of a node's   #
+# next hop toward an originator (learned, switched, or lost) is appended to a  #
+# compact per-(node, originator) index of time steps, so questions such as     #
+# when a route was first learned or how often it flapped are answered by       #
+# binary search after a run instead of by diffing successive text reports.     #
+################################################################################
+
+import array
+import bisect
+
+import registry
+
+
+# Next hop stored for a lost route
+NO_ROUTE = -1
+
+
+class RouteTimeline:
+    # Constructor
+    def __init__(self):
+        # Entries convention: <key>(node ID, originator ID) : <value> (time step array, next hop ID array)
+        # Time steps only grow, so both arrays are append-only and searchable by bisect
+        self.entries = {}
+
+        # Originators convention: <key>node ID : <value> set of originator IDs with an entry
+        self.originators = {}
+
+        self.changeTotal = 0
+
+    # Record the next hop (None for a lost route) of a node toward an originator from a time step on
+    def record(self, clock, node, originator, nextHop):
+        key = (node, originator)
+        hop = NO_ROUTE if nextHop is None else nextHop
+
+        if key not in self.entries:
+            # Nothing to record for a route that was never learned
+            if hop == NO_ROUTE:
+                return False
+
+            self.entries[key] = (array.array("l"), array.array("l"))
+            self.originators.setdefault(node, set()).add(originator)
+
+        ticks, hops = self.entries[key]
+        if len(hops) > 0 and hops[-1] == hop:
+            return False
+
+        # Several changes within one time step keep only the last, undoing the step if it ends where it began
+        if len(ticks) > 0 and ticks[-1] == clock:
+            if len(hops) > 1 and hops[-2] == hop:
+                ticks.pop()
+                hops.pop()
+                self.changeTotal -= 1
+            elif len(hops) == 1 and hop == NO_ROUTE:
+                # Learned and lost in the same time step, as if never learned
+                del self.entries[key]
+                self.originators[node].discard(originator)
+                self.changeTotal -= 1
+            else:
+                hops[-1] = hop
+        else:
+            ticks.append(clock)
+            hops.append(hop)
+            self.changeTotal += 1
+
+        return True
+
+    # Next hop ID of a node toward an originator at a time step (None if there was no route)
+    def nextHopAt(self, node, originator, clock):
+        if (node, originator) not in self.entries:
+            return None
+
+        ticks, hops = self.entries[(node, originator)]
+        index = bisect.bisect_right(ticks, clock) - 1
+        if index < 0 or hops[index] == NO_ROUTE:
+            return None
+
+        return hops[index]
+
+    # Every route of a node at a time step as <key>originator ID : <value> next hop ID
+    def routesAt(self, node, clock):
+        routes = {}
+        for originator in self.originators.get(node, ()):
+            nextHop = self.nextHopAt(node, originator, clock)
+            if nextHop is not None:
+                routes[originator] = nextHop
+
+        return routes
+
+    # Time step a node first learned a route toward an originator (None if it never did)
+    def firstLearned(self, node, originator):
+        if (node, originator) not in self.entries:
+            return None
+
+        return self.entries[(node, originator)][0][0]
+
+    # First time step from start on where a node routed toward an originator through the given next hop
+    def firstVia(self, node, originator, nextHop, start=0):
+        if (node, originator) not in self.entries:
+            return None
+
+        ticks, hops = self.entries[(node, originator)]
+        index = max(bisect.bisect_right(ticks, start) - 1, 0)
+        for position in xrange(index, len(hops)):
+            if hops[position] == nextHop:
+                return max(ticks[position], start)
+
+        return None
+
+    # Changes of a node's route toward an originator in the time steps [start, end) as (time step, next hop) pairs
+    def changes(self, node, originator, start=0, end=None):
+        if (node, originator) not in self.entries:
+            return []
+
+        ticks, hops = self.entries[(node, originator)]
+        first = bisect.bisect_left(ticks, start)
+        last = len(ticks) if end is None else bisect.bisect_left(ticks, end)
+
+        return [(ticks[index], None if hops[index] == NO_ROUTE else hops[index]) for index in xrange(first, last)]
+
+    # Number of route changes (including learning and losing it) in the time steps [start, end)
+    def changeCount(self, node, originator, start=0, end=None):
+        if (node, originator) not in self.entries:
+            return 0
+
+        ticks = self.entries[(node, originator)][0]
+        last = len(ticks) if end is None else bisect.bisect_left(ticks, end)
+        return max(last - bisect.bisect_left(ticks, start), 0)
+
+    # Forget every recorded change
+    def clear(self):
+        self.entries = {}
+        self.originators = {}
+        self.changeTotal = 0
+
+    # Number of (node, originator) pairs with an entry
+    def __len__(self):
+        return len(self.entries)
+
+    # Report the route history of a node toward an originator to a string
+    def reportString(self, node, originator):
+        report = "Route History " + registry.ip(node) + " -> " + registry.ip(originator) + ":\n"
+        for clock, nextHop in self.changes(node, originator):
+            if nextHop is None:
+                report += "Time: " + str(clock) + " Lost\n"
+            else:
+                report += "Time: " + str(clock) + " Next Hop: " + registry.ip(nextHop) + "\n"
+
+        return report
@@ -0,0 +1,290 @@
+################################################################################
+# topology.py                                                                  #
+# Bulk topology import and export for the BATMAN Simulator. Edge-list, CSV,    #
+# and GraphML files are read one record at a time (GraphML through iterparse,  #
+# clearing each element once used) and applied straight to the controller, so  #
+# a field deployment map of tens of thousands of nodes never sits in memory    #
+# as a whole. An import can run in slices to keep the GUI responsive, and the  #
+# writers stream the current neighbor listings back out in the same formats.   #
+#                                                                              #
+# Edge-list files have one record per line (# comments are skipped):           #
+#   <IP>                        a node without links                           #
+#   <IP> <IP> [oneway]          a link, both ways unless marked oneway         #
+# CSV files have the columns source, target, oneway (header row optional).     #
+################################################################################
+
+import csv
+import xml.etree.cElementTree as ElementTree
+from xml.sax.saxutils import quoteattr
+
+import user
+
+
+FORMATS = ("edges", "csv", "graphml")
+
+# File extensions of each format (anything else is read as an edge list)
+EXTENSIONS = {".csv": "csv", ".graphml": "graphml", ".xml": "graphml"}
+
+GRAPHML_NAMESPACE = "http://graphml.graphdrawing.org/xmlns"
+
+
+# Format of a file from its extension
+def formatOf(fileName):
+    for extension, name in EXTENSIONS.iteritems():
+        if fileName.lower().endswith(extension):
+            return name
+
+    return "edges"
+
+
+# Records convention: ("node", IP, OGM interval or None, uni-directional or None)
+# and ("edge", first IP, second IP, one way)
+def readEdges(fileIN):
+    for number, line in enumerate(fileIN):
+        fields = line.split("#", 1)[0].split()
+        if len(fields) == 0:
+            continue
+
+        if len(fields) == 1:
+            yield ("node", fields[0], None, None)
+        elif len(fields) == 2 or (len(fields) == 3 and fields[2].lower() == "oneway"):
+            yield ("edge", fields[0], fields[1], len(fields) == 3)
+        else:
+            raise ValueError("Topology line " + str(number + 1) + ": " + line.strip())
+
+
+def readCSV(fileIN):
+    for number, row in enumerate(csv.reader(fileIN)):
+        fields = [each.strip() for each in row]
+        while len(fields) > 0 and fields[-1] == "":
+            fields.pop()
+
+        if len(fields) == 0 or fields[0].startswith("#"):
+            continue
+        if number == 0 and fields[0].lower() in ("source", "node", "ip"):
+            continue
+
+        if len(fields) == 1:
+            yield ("node", fields[0], None, None)
+        else:
+            oneWay = len(fields) > 2 and fields[2].lower() in ("1", "true", "yes", "oneway")
+            yield ("edge", fields[0], fields[1], oneWay)
+
+
+# Tag of an element without its namespace
+def localName(element):
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def readGraphML(fileIN):
+    # Keys convention: <key>key ID : <value> attribute name
+    keys = {}
+    directed = False
+
+    # Open elements, innermost last, so a parsed element can be removed from its parent
+    parents = []
+
+    for event, element in ElementTree.iterparse(fileIN, events=("start", "end")):
+        tag = localName(element)
+
+        if event == "start":
+            if tag == "graph":
+                directed = element.get("edgedefault", "undirected") == "directed"
+            parents.append(element)
+            continue
+
+        parents.pop()
+
+        if tag == "key":
+            keys[element.get("id")] = element.get("attr.name", element.get("id"))
+        elif tag == "node":
+            data = dict([(keys.get(each.get("key"), each.get("key")), (each.text or "").strip())
+                         for each in element if localName(each) == "data"])
+            castTime = int(data["interval"]) if data.get("interval") else None
+            direction = data["directional"].lower() == "true" if data.get("directional") else None
+            yield ("node", element.get("id"), castTime, direction)
+        elif tag == "edge":
+            oneWay = element.get("directed", "true" if directed else "false") == "true"
+            yield ("edge", element.get("source"), element.get("target"), oneWay)
+        else:
+            continue
+
+        # Drop the parsed element and take it out of its parent so the tree never grows
+        element.clear()
+        if len(parents) > 0:
+            parents[-1].remove(element)
+
+
+READERS = {"edges": readEdges, "csv": readCSV, "graphml": readGraphML}
+
+
+class Importer:
+    # Constructor - nodes not given an interval in the file get castTime
+    def __init__(self, controller, fileName, format=None, castTime=10, direction=False):
+        self.controller = controller
+        self.fileName = fileName
+        self.format = format or formatOf(fileName)
+        self.castTime = castTime
+        self.direction = direction
+
+        if self.format not in READERS:
+            raise ValueError("Unknown topology format " + str(self.format))
+
+        self.fileIN = open(fileName, "rb")
+        self.records = READERS[self.format](self.fileIN)
+
+        self.nodes = 0
+        self.links = 0
+        self.selfLoops = 0
+        self.done = False
+
+    # Apply up to limit records (all of them for None), returning True while more remain
+    def step(self, limit=None):
+        if self.done:
+            return False
+
+        count = 0
+        try:
+            for record in self.records:
+                if record[0] == "node":
+                    self.node(record[1], record[2], record[3])
+                else:
+                    self.link(record[1], record[2], record[3])
+
+                count += 1
+                if limit is not None and count >= limit:
+                    return True
+        except SyntaxError as error:
+            self.close()
+            raise ValueError("Topology file " + self.fileName + ": " + str(error))
+        except ValueError:
+            self.close()
+            raise
+
+        self.close()
+        return False
+
+    # Apply every record
+    def run(self):
+        self.step()
+        return self
+
+    # Find a node, creating and adding it on first sight
+    def node(self, ip, castTime=None, direction=None):
+        found = self.controller.findUser(ip)
+        if found is not None:
+            return found
+
+        newUser = user.User(ip=ip, castTime=self.castTime if castTime is None else castTime,
+                            direction=self.direction if direction is None else direction)
+        self.controller.addUser(newUser)
+        self.nodes += 1
+        return newUser
+
+    # Link two nodes, both ways unless oneWay
+    # A node linked to itself is added without the link, which the simulator cannot use or write back out
+    def link(self, first, second, oneWay=False):
+        firstUser = self.node(first)
+        if second == first:
+            self.selfLoops += 1
+            return
+
+        secondUser = self.node(second)
+        if firstUser.addNeighbor(secondUser):
+            self.links += 1
+        if not oneWay and secondUser.addNeighbor(firstUser):
+            self.links += 1
+
+    def close(self):
+        self.done = True
+        if not self.fileIN.closed:
+            self.fileIN.close()
+
+    # Report the import progress to a string
+    def reportString(self):
+        state = "done" if self.done else "loading"
+        return "Topology " + self.fileName + " (" + self.format + ", " + state + "): " + str(self.nodes) + \
+               " nodes added, " + str(self.links) + " neighbor listings" + \
+               (", " + str(self.selfLoops) + " self-loops skipped" if self.selfLoops > 0 else "") + "\n"
+
+
+# Import a whole topology file into the controller
+def load(controller, fileName, format=None, castTime=10):
+    return Importer(controller, fileName, format, castTime).run()
+
+
+# Links of the network in node order as (first, second, one way), each two-way link once
+def links(controller):
+    network = controller.network
+    for nodeID in network:
+        node = network[nodeID]
+        for neighbor in node.neighbors:
+            if neighbor.ID not in network:
+                continue
+
+            mutual = nodeID in neighbor.neighborIndex
+            if not mutual:
+                yield node, neighbor, True
+            elif controller.rank(nodeID) < controller.rank(neighbor.ID):
+                yield node, neighbor, False
+
+
+# Write the network as an edge list, a CSV file, or GraphML
+def save(controller, fileName, format=None):
+    format = format or formatOf(fileName)
+    if format not in FORMATS:
+        raise ValueError("Unknown topology format " + str(format))
+
+    fileOUT = open(fileName, "wb")
+    try:
+        if format == "graphml":
+            writeGraphML(controller, fileOUT)
+        elif format == "csv":
+            writeCSV(controller, fileOUT)
+        else:
+            writeEdges(controller, fileOUT)
+    finally:
+        fileOUT.close()
+
+
+def writeEdges(controller, fileOUT):
+    for nodeID in controller.network:
+        node = controller.network[nodeID]
+        if len(node.neighbors) == 0 and len(node.listedBy) == 0:
+            fileOUT.write(node.IP + "\n")
+
+    for first, second, oneWay in links(controller):
+        fileOUT.write(first.IP + " " + second.IP + (" oneway\n" if oneWay else "\n"))
+
+
+def writeCSV(controller, fileOUT):
+    writer = csv.writer(fileOUT, lineterminator="\n")
+    writer.writerow(("source", "target", "oneway"))
+
+    for nodeID in controller.network:
+        node = controller.network[nodeID]
+        if len(node.neighbors) == 0 and len(node.listedBy) == 0:
+            writer.writerow((node.IP, "", ""))
+
+    for first, second, oneWay in links(controller):
+        writer.writerow((first.IP, second.IP, "oneway" if oneWay else ""))
+
+
+# GraphML keeps the node intervals and directions as well
+def writeGraphML(controller, fileOUT):
+    fileOUT.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    fileOUT.write('<graphml xmlns="' + GRAPHML_NAMESPACE + '">\n')
+    fileOUT.write('  <key id="interval" for="node" attr.name="interval" attr.type="int"/>\n')
+    fileOUT.write('  <key id="directional" for="node" attr.name="directional" attr.type="boolean"/>\n')
+    fileOUT.write('  <graph id="batman" edgedefault="undirected">\n')
+
+    for nodeID in controller.network:
+        node = controller.network[nodeID]
+        fileOUT.write('    <node id=' + quoteattr(node.IP) + '><data key="interval">' + str(node.broadcastTime) +
+                      '</data><data key="directional">' + str(node.directional).lower() + '</data></node>\n')
+
+    for first, second, oneWay in links(controller):
+        fileOUT.write('    <edge source=' + quoteattr(first.IP) + ' target=' + quoteattr(second.IP) +
+                      (' directed="true"/>\n' if oneWay else '/>\n'))
+
+    fileOUT.write('  </graph>\n</graphml>\n')
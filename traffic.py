@@ -0,0 +1,226 @@
+################################################################################
+# traffic.py                                                                   #
+# Data traffic load generator for the BATMAN Simulator. Flows inject messages  #
+# between chosen (or random) node pairs at configurable rates and sizes while  #
+# the controller runs, sharing the same per-tick transport as the OGMs. The    #
+# generator measures delivered throughput, drop rate, and queue occupancy so   #
+# the data load the routing layer sustains before the queues collapse can be   #
+# found with a sweep over increasing rates.                                    #
+################################################################################
+
+import random
+
+import registry
+
+
+class Flow:
+    # Constructor - source and destination are node IDs, rate is messages per time step (fractions
+    # accumulate), size is payload bytes
+    def __init__(self, source, destination, rate=1.0, size=64, ttl=180, key=None):
+        self.key = key
+        self.source = source
+        self.destination = destination
+        self.rate = rate
+        self.size = max(size, 1)
+        self.ttl = ttl
+
+        self.credit = 0.0
+        self.injected = 0
+        self.unroutable = 0
+
+    # Inject the messages due this time step through the source node
+    def inject(self, network):
+        self.credit += self.rate
+
+        while self.credit >= 1.0:
+            self.credit -= 1.0
+
+            if self.source not in network:
+                self.unroutable += 1
+                continue
+
+            sent = network[self.source].sendMessageTo(self.destination, ttl=self.ttl, data="x" * self.size)
+            if sent is not None:
+                sent.flow = self.key
+                self.injected += 1
+            else:
+                self.unroutable += 1
+
+
+class TrafficGenerator:
+    # Constructor
+    def __init__(self, controller, seed=None):
+        self.controller = controller
+        self.flows = []
+        self.random = random.Random(seed)
+
+        self.running = False
+        self.ticks = 0
+        self.startDelivered = 0
+        self.startBytes = 0
+
+        # Queue occupancy samples (send, receive, and link queues across the mesh)
+        self.queueTotal = 0
+        self.queuePeak = 0
+        self.nodePeak = 0
+
+    # Add a flow between two node IPs
+    def addFlow(self, source, destination, rate=1.0, size=64, ttl=180):
+        return self.addFlowIDs(registry.intern(source), registry.intern(destination), rate, size, ttl)
+
+    # Add a flow between two node IDs
+    def addFlowIDs(self, source, destination, rate=1.0, size=64, ttl=180):
+        flow = Flow(source, destination, rate, size, ttl, key="flow" + str(len(self.flows)))
+        self.flows.append(flow)
+        return flow
+
+    # Add flows between random distinct node pairs
+    def addRandomFlows(self, count, rate=1.0, size=64, ttl=180):
+        ids = self.controller.network.keys()
+        if len(ids) < 2:
+            return []
+
+        added = []
+        for index in range(0, count):
+            source, destination = self.random.sample(ids, 2)
+            added.append(self.addFlowIDs(source, destination, rate, size, ttl))
+
+        return added
+
+    # Start injecting with every controller time step
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.startDelivered, self.startBytes = self.deliveredCounts()
+            self.controller.addListener(self.step)
+
+    # Stop injecting
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.controller.removeListener(self.step)
+
+    # Controller listener: inject the next messages and sample queue occupancy
+    def step(self, clock, hops):
+        self.ticks += 1
+
+        for flow in self.flows:
+            flow.inject(self.controller.network)
+
+        # Packets waiting on a node's outgoing links count toward its occupancy
+        backlog = {}
+        for linkKey in self.controller.activeLinks:
+            backlog[linkKey[0]] = backlog.get(linkKey[0], 0) + len(self.controller.links[linkKey])
+
+        total = 0
+        for key, value in self.controller.network.iteritems():
+            occupancy = len(value.sendQueue) + len(value.receiveQueue) + backlog.get(key, 0)
+            total += occupancy
+            if occupancy > self.nodePeak:
+                self.nodePeak = occupancy
+
+        self.queueTotal += total
+        if total > self.queuePeak:
+            self.queuePeak = total
+
+    # Run the controller with traffic, optionally letting the routing converge first
+    def run(self, ticks, warmup=0):
+        if warmup > 0:
+            self.controller.tick(warmup)
+
+        self.start()
+        self.controller.tick(ticks)
+        self.stop()
+
+        return self.report()
+
+    # Total messages and bytes delivered across the mesh
+    def deliveredCounts(self):
+        messages = 0
+        size = 0
+        for key, value in self.controller.network.iteritems():
+            messages += value.messagesDelivered
+            size += value.bytesDelivered
+
+        return messages, size
+
+    # Data packets still waiting in any queue
+    def inFlight(self):
+        count = 0
+        for key, value in self.controller.network.iteritems():
+            for each in value.sendQueue:
+                if each.payload != "":
+                    count += 1
+            for each in value.receiveQueue:
+                if each.payload != "":
+                    count += 1
+
+        for linkKey in self.controller.activeLinks:
+            for each in self.controller.links[linkKey].packets():
+                if each.payload != "":
+                    count += 1
+
+        return count
+
+    # Report the measurements as a dictionary
+    def report(self):
+        injected = 0
+        unroutable = 0
+        for flow in self.flows:
+            injected += flow.injected
+            unroutable += flow.unroutable
+
+        messages, size = self.deliveredCounts()
+        delivered = messages - self.startDelivered
+        deliveredBytes = size - self.startBytes
+        inFlight = self.inFlight()
+        dropped = max(injected - delivered - inFlight, 0)
+        ticks = max(self.ticks, 1)
+        latency, hops = self.controller.deliveryStats.merged([flow.key for flow in self.flows])
+
+        return {"ticks": self.ticks,
+                "flows": len(self.flows),
+                "injected": injected,
+                "unroutable": unroutable,
+                "delivered": delivered,
+                "inFlight": inFlight,
+                "dropped": dropped,
+                "dropRate": float(dropped) / injected if injected > 0 else 0.0,
+                "throughput": float(delivered) / ticks,
+                "byteThroughput": float(deliveredBytes) / ticks,
+                "meanQueue": float(self.queueTotal) / ticks,
+                "peakQueue": self.queuePeak,
+                "peakNodeQueue": self.nodePeak,
+                "latencyP50": latency.percentile(50),
+                "latencyP99": latency.percentile(99),
+                "latencyMax": latency.max,
+                "hopsP50": hops.percentile(50),
+                "hopsMax": hops.max}
+
+    # Report the measurements to a string
+    def reportString(self):
+        report = self.report()
+        keys = ("ticks", "flows", "injected", "unroutable", "delivered", "inFlight", "dropped", "dropRate",
+                "throughput", "byteThroughput", "meanQueue", "peakQueue", "peakNodeQueue", "latencyP50", "latencyP99",
+                "latencyMax", "hopsP50", "hopsMax")
+
+        output = "Traffic Report:\n"
+        for key in keys:
+            output += key + ": " + str(report[key]) + "\n"
+
+        return output
+
+
+# Measure the same random workload at increasing rates on fresh networks from build()
+def sweep(build, rates, ticks, flows=10, size=64, warmup=100, seed=None):
+    reports = []
+    for rate in rates:
+        generator = TrafficGenerator(build(), seed=seed)
+        generator.controller.tick(warmup)
+        generator.addRandomFlows(flows, rate=rate, size=size)
+
+        report = generator.run(ticks)
+        report["rate"] = rate
+        reports.append(report)
+
+    return reports
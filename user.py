@@ -11,41 +11,98 @@
 
 
 import ogm as ogm
+import memory
+import registry
 import time
 import copy
 
 
+# Drop policies for full queues: drop the arrival, drop the oldest queued packet, or drop the
+# queued packet with the lowest sequence from the arrival's originator
+DROP_POLICIES = ("tail", "oldest", "sequence")
+
+# Sections of the node report, rendered and cached separately
+REPORT_SECTIONS = ("header", "drops", "neighbors", "send", "receive", "messages", "topology")
+
+# Memory structures of the send and receive queues, by queue name
+QUEUE_STRUCTURES = {"send": "sendQueue", "receive": "receiveQueue"}
+
+
 class User:
     # Constructor method
     def __init__(self, ip="0.0.0.0", castTime=1, direction=False):
+        # The IP is kept for reporting, everything internal uses the interned node ID
         self.IP = ip
+        self.ID = registry.intern(ip)
 
-        # All network nodes convention: <key>IP : <value> User instance
+        # All network nodes convention: <key>ID : <value> User instance
         self.allNet = {}
 
-        # Neighbors convention: User instances
+        # Neighbors convention: User instances, indexed <key>ID : <value> User instance
+        # Listed by convention (reverse index): <key>ID : <value> User instance listing this user as a neighbor
         self.neighbors = []
+        self.neighborIndex = {}
+        self.listedBy = {}
 
         self.broadcastTime = castTime
         self.timeToCast = 0
         self.directional = direction
         self.spoof = False
         self.spoofIP = ""
+        self.spoofID = None
 
         # Send and receive queues should have OGM or packet (datagram)
         self.sendQueue = []
         self.receiveQueue = []
         self.queueLimit = 1000
+        self.dropPolicy = "tail"
 
-        # Received OGMs convention: <key>IP : <value> OGM instance
+        # Drops convention: <key>"queue:policy" reason : <value> packets dropped
+        self.drops = {}
+
+        # Received OGMs convention: <key>Originator ID : <value> OGM instance
+        # Routes via convention (reverse index): <key>next hop ID : <value> set of originator IDs routed through it
         self.receivedOGMs = {}
+        self.routesVia = {}
 
-        # Received messages convention: <key>Origin IP : <value> OGM instance
+        # Received messages convention: <key>Originator ID : <value> OGM instance
         self.receivedMessages = {}
+        self.messagesDelivered = 0
+        self.bytesDelivered = 0
+
+        # Held convention: <key>memory structure : <value> held counters of the packets in it (see memory.py)
+        self.held = dict([(name, memory.newHeld()) for name in memory.NODE_STRUCTURES])
+
+        # Shared delivery latency and hop histograms, route timeline, and spoof detector (set by the controller)
+        # and the current time step
+        self.deliveryStats = None
+        self.timeline = None
+        self.detector = None
+        self.clock = 0
 
         self.sequence = 0
         self.keepAlive = 300
 
+        # Report caching: rendered sections and the sections changed since the last full report
+        self.reportCache = {}
+        self.dirty = set(REPORT_SECTIONS)
+
+        # Changes since the last delta report: sections, <key>ID : <value> True added / False removed for
+        # neighbors and routes, and <key>Originator ID : <value> OGM for new messages
+        self.deltaSections = set(REPORT_SECTIONS)
+        self.deltaNeighbors = {}
+        self.deltaRoutes = {}
+        self.deltaMessages = {}
+
+        # Shared set of node IDs with changes to report (set by the controller)
+        self.changedNodes = None
+
+        # Shared set of the originator IDs tracked in sampled mode (set by the controller, None tracks all)
+        # Untracked originators send no OGMs, and stray OGMs from them are only counted
+        self.tracked = None
+        self.ogmsSuppressed = 0
+        self.untrackedOGMs = 0
+
     # Create and broadcast OGMs for all neighbors and stick in send queue
     def broadcastOGMs(self, deltaTime):
         # Check for the broadcast time and broadcast if time step is reached
@@ -54,20 +111,22 @@ class User:
         # Create an OGM for each neighbor and place in the send queue
         if self.timeToCast % self.broadcastTime == 0:
             # Check for spoofing
-            ip = ""
+            origin = self.ID
             if self.spoof:
-                ip = self.spoofIP
-            else:
-                ip = self.IP
+                origin = self.spoofID
 
-            for neighbor in self.neighbors:
-                outgoingOGM = ogm.OGM(origIP=ip, sendIP=ip, seq=self.sequence,
-                                      ttl=self.keepAlive, direction=self.directional)
-                outgoingOGM.nextHop = neighbor.IP
-                self.sendQueue.append(outgoingOGM)
+            if self.tracked is not None and origin not in self.tracked:
+                self.ogmsSuppressed += len(self.neighbors)
+            else:
+                for neighbor in self.neighbors:
+                    outgoingOGM = ogm.OGM(origin=origin, sender=origin, seq=self.sequence,
+                                          ttl=self.keepAlive, direction=self.directional)
+                    outgoingOGM.nextHop = neighbor.ID
+                    self.enqueue(self.sendQueue, outgoingOGM, "send")
 
             # Increment the sequence number
             self.sequence += 1
+            self.changed("header")
 
             # Reset the Time to Cast
             self.timeToCast = 0
@@ -76,143 +135,474 @@ class User:
     def receiveOGM(self):
         if len(self.receiveQueue) > 0:
             incomingOGM = self.receiveQueue.pop(0)
+            memory.hold(self.held["receiveQueue"], incomingOGM, -1)
+            self.changed("receive")
 
             # Check for self-returning OGMs and uni-directional communication (ver 0.2)
-            if incomingOGM.senderIP == self.IP or incomingOGM.directional:
+            if incomingOGM.sender == self.ID or incomingOGM.directional:
                 return False
 
-            # Update the trace route listing (just IP address)
-            incomingOGM.traceroute.append(self.IP)
+            # Update the trace route listing (just node ID)
+            incomingOGM.traceroute.append(self.ID)
 
             # Check for data payload and treat as message if so
             if incomingOGM.payload != "":
                 # Check if the message has reached its destination
-                if incomingOGM.destinationIP == self.IP:
-                    self.receivedMessages[incomingOGM.originatorIP] = incomingOGM
+                if incomingOGM.destination == self.ID:
+                    if incomingOGM.originator in self.receivedMessages:
+                        memory.hold(self.held["receivedMessages"], self.receivedMessages[incomingOGM.originator], -1)
+                    self.receivedMessages[incomingOGM.originator] = incomingOGM
+                    memory.hold(self.held["receivedMessages"], incomingOGM)
+                    self.deltaMessages[incomingOGM.originator] = incomingOGM
+                    self.changed("messages")
+                    self.messagesDelivered += 1
+                    self.bytesDelivered += len(incomingOGM.payload)
+
+                    if self.deliveryStats is not None:
+                        flow = incomingOGM.flow
+                        if flow is None:
+                            flow = (incomingOGM.originator, incomingOGM.destination)
+                        self.deliveryStats.record(flow, self.clock - incomingOGM.injectTick,
+                                                  len(incomingOGM.traceroute) - 1)
                 else:
                     # Try to forward the message through the system
-                    if incomingOGM.destinationIP in self.receivedOGMs.keys():
-                        forwardHop = self.receivedOGMs[incomingOGM.destinationIP]
-                        incomingOGM.nextHop = forwardHop.senderIP
+                    if incomingOGM.destination in self.receivedOGMs:
+                        forwardHop = self.receivedOGMs[incomingOGM.destination]
+                        incomingOGM.nextHop = forwardHop.sender
                         incomingOGM.TTL -= 1
 
                         if incomingOGM.TTL > 0:
-                            self.sendQueue.append(incomingOGM)
+                            self.enqueue(self.sendQueue, incomingOGM, "send")
 
                 return True
 
-            # Check the originator and sender IPs
-            if incomingOGM.originatorIP == incomingOGM.senderIP:
-                # If they matched, the OGM goes directly to a neighbor, check the list
-                found = False
-                for index in self.neighbors:
-                    if index.IP == incomingOGM.originatorIP:
-                        found = True
+            # Check the OGM for signs of spoofing before it changes any state
+            if self.detector is not None:
+                self.detector.check(self, incomingOGM)
+
+            # In sampled mode only the tracked originators are kept and forwarded
+            if self.tracked is not None and incomingOGM.originator not in self.tracked:
+                self.untrackedOGMs += 1
+                return False
 
-                # If the found flag was not triggered, a new neighbor was detected
-                if not found:
-                    self.neighbors.append(self.allNet[incomingOGM.originatorIP])
-                    self.receivedOGMs[incomingOGM.originatorIP] = incomingOGM
+            # Only OGMs carrying a sequence newer than the known one are rebroadcast
+            isNew = True
+            if incomingOGM.originator in self.receivedOGMs:
+                isNew = self.receivedOGMs[incomingOGM.originator].sequence < incomingOGM.sequence
+
+            # Check the originator and sender IDs
+            if incomingOGM.originator == incomingOGM.sender:
+                # If they matched, the OGM goes directly to a neighbor, check the list
+                # A new neighbor was detected if it is not listed yet
+                # (a spoofed originator may not be a node in the network at all)
+                if incomingOGM.originator not in self.neighborIndex and incomingOGM.originator in self.allNet:
+                    self.addNeighbor(self.allNet[incomingOGM.originator])
+                    self.setRoute(incomingOGM.originator, incomingOGM)
 
             # Check the received OGMs if this is the latest sequence number
-            if incomingOGM.originatorIP in self.receivedOGMs.keys():
-                if self.receivedOGMs[incomingOGM.originatorIP].sequence < incomingOGM.sequence:
-                    self.receivedOGMs[incomingOGM.originatorIP] = incomingOGM
+            if incomingOGM.originator in self.receivedOGMs:
+                if self.receivedOGMs[incomingOGM.originator].sequence < incomingOGM.sequence:
+                    self.setRoute(incomingOGM.originator, incomingOGM)
             else:
-                self.receivedOGMs[incomingOGM.originatorIP] = incomingOGM
+                self.setRoute(incomingOGM.originator, incomingOGM)
 
             # Additionally, this OGM must be forwarded through the network
             incomingOGM.TTL -= 1
 
-            # Check for a live packet
-            if incomingOGM.TTL > 0:
+            # Check for a live packet that has not been rebroadcast already
+            if incomingOGM.TTL > 0 and isNew:
                 for index in self.neighbors:
-                    if incomingOGM.originatorIP is not index.IP:
+                    if incomingOGM.originator != index.ID:
                         outgoingOGM = incomingOGM.copy()
 
-                        # Replace the sender's IP with the current user's and broadcast
-                        outgoingOGM.senderIP = self.IP
+                        # Replace the sender with the current user and broadcast
+                        outgoingOGM.sender = self.ID
                         outgoingOGM.directional = self.directional
-                        outgoingOGM.nextHop = index.IP
+                        outgoingOGM.nextHop = index.ID
+
+                        self.enqueue(self.sendQueue, outgoingOGM, "send")
 
-                        self.sendQueue.append(outgoingOGM)
+    # Keep an OGM as the route toward its originator, recording a next hop change in the timeline
+    def setRoute(self, originator, packet):
+        known = self.receivedOGMs.get(originator)
+        self.receivedOGMs[originator] = packet
+        memory.hold(self.held["receivedOGMs"], packet)
+        if known is not None:
+            memory.hold(self.held["receivedOGMs"], known, -1)
+
+        if known is None or known.sender != packet.sender:
+            if known is not None:
+                self.forgetVia(known.sender, originator)
+            else:
+                self.noteDelta(self.deltaRoutes, originator, True)
+                self.changed("topology")
+            self.routesVia.setdefault(packet.sender, set()).add(originator)
+
+            if self.timeline is not None:
+                self.timeline.record(self.clock, self.ID, originator, packet.sender)
+
+    # Forget the route toward an originator, recording the loss in the timeline
+    def dropRoute(self, originator):
+        known = self.receivedOGMs.pop(originator, None)
+        if known is None:
+            return
+
+        memory.hold(self.held["receivedOGMs"], known, -1)
+
+        self.forgetVia(known.sender, originator)
+        self.noteDelta(self.deltaRoutes, originator, False)
+        self.changed("topology")
+
+        if self.timeline is not None:
+            self.timeline.record(self.clock, self.ID, originator, None)
+
+    # Forget every route through a next hop, returning the originators dropped
+    def dropRoutesVia(self, nextHop):
+        originators = self.routesVia.pop(nextHop, set())
+        for originator in originators:
+            known = self.receivedOGMs.pop(originator, None)
+            if known is not None:
+                memory.hold(self.held["receivedOGMs"], known, -1)
+            self.noteDelta(self.deltaRoutes, originator, False)
+            self.changed("topology")
+
+            if self.timeline is not None:
+                self.timeline.record(self.clock, self.ID, originator, None)
+
+        return originators
+
+    # Remove an originator from the routes via index of a next hop
+    def forgetVia(self, nextHop, originator):
+        if nextHop in self.routesVia:
+            self.routesVia[nextHop].discard(originator)
+            if len(self.routesVia[nextHop]) == 0:
+                del self.routesVia[nextHop]
+
+    # Mark a report section as changed
+    def changed(self, section):
+        self.dirty.add(section)
+
+        if section not in self.deltaSections:
+            self.deltaSections.add(section)
+            if self.changedNodes is not None:
+                self.changedNodes.add(self.ID)
+
+    # Note an addition or removal for the delta report, cancelling out an opposite one not yet reported
+    def noteDelta(self, table, key, added):
+        if table.get(key, added) != added:
+            del table[key]
+        else:
+            table[key] = added
+
+    # Queue a packet (send, receive, or outgoing link queue) enforcing the queue limit with the drop policy
+    # The packets are counted in held (the node's own counters of a send or receive queue by default)
+    # Returns False when the arriving packet itself was dropped
+    def enqueue(self, queue, packet, name="send", held=None):
+        if name != "link":
+            self.changed(name)
+        if held is None:
+            held = self.held[QUEUE_STRUCTURES[name]]
+
+        if len(queue) < self.queueLimit:
+            queue.append(packet)
+            memory.hold(held, packet)
+            return True
+
+        reason = "tail"
+        if self.dropPolicy == "oldest":
+            memory.hold(held, queue[0], -1)
+            del queue[0]
+            reason = "oldest"
+        elif self.dropPolicy == "sequence" and packet.payload == "":
+            lowest = None
+            for index, each in enumerate(queue):
+                if each.originator == packet.originator and each.payload == "":
+                    if lowest is None or each.sequence < queue[lowest].sequence:
+                        lowest = index
+
+            if lowest is not None and queue[lowest].sequence <= packet.sequence:
+                memory.hold(held, queue[lowest], -1)
+                del queue[lowest]
+                reason = "sequence"
+
+        key = name + ":" + reason
+        self.drops[key] = self.drops.get(key, 0) + 1
+        self.changed("drops")
+
+        if reason == "tail":
+            return False
+
+        queue.append(packet)
+        memory.hold(held, packet)
+        return True
+
+    # Queue a batch of packets, appending in one step when the whole batch fits
+    def enqueueBatch(self, queue, packets, name="receive", held=None):
+        if held is None:
+            held = self.held[QUEUE_STRUCTURES[name]]
+
+        if len(queue) + len(packets) <= self.queueLimit:
+            queue.extend(packets)
+            for packet in packets:
+                memory.hold(held, packet)
+            if name != "link":
+                self.changed(name)
+        else:
+            for packet in packets:
+                self.enqueue(queue, packet, name, held)
+
+    # Empty the send or receive queue, returning the packets it held
+    def clearQueue(self, name="send"):
+        structure = QUEUE_STRUCTURES[name]
+        queue = getattr(self, structure)
+        cleared = list(queue)
+
+        del queue[:]
+        self.held[structure] = memory.newHeld()
+        self.changed(name)
+        return cleared
+
+    # Total packets dropped by the queue limits
+    def dropCount(self):
+        return sum(self.drops.values())
+
+    # Receive up to limit OGMs from the queue (all of them when limit is None)
+    def receiveOGMs(self, limit=None):
+        count = 0
+        while len(self.receiveQueue) > 0 and (limit is None or count < limit):
+            self.receiveOGM()
+            count += 1
+
+        return count
 
     # Add unique neighbor to the user's listing (used for initial state and for altering in GUI)
     def addNeighbor(self, neighbor):
-        found = False
-        for each in self.neighbors:
-            if each.IP == neighbor.IP:
-                found = True
+        if neighbor is None or neighbor.ID in self.neighborIndex:
+            return False
+
+        self.neighbors.append(neighbor)
+        self.neighborIndex[neighbor.ID] = neighbor
+        neighbor.listedBy[self.ID] = self
 
-        if not found:
-            self.neighbors.append(neighbor)
+        self.noteDelta(self.deltaNeighbors, neighbor.ID, True)
+        self.changed("neighbors")
+        return True
 
-    # Remove a neighbor from the listing
+    # Remove a neighbor from the listing along with the routes through it (nothing happens if it is not listed)
     def removeNeighbor(self, neighbor):
-        self.neighbors.remove(neighbor)
+        if neighbor is None or neighbor.ID not in self.neighborIndex:
+            return False
+
+        listed = self.neighborIndex.pop(neighbor.ID)
+        for index, each in enumerate(self.neighbors):
+            if each.ID == neighbor.ID:
+                del self.neighbors[index]
+                break
+
+        listed.listedBy.pop(self.ID, None)
+        self.noteDelta(self.deltaNeighbors, neighbor.ID, False)
+        self.changed("neighbors")
+
+        self.dropRoutesVia(neighbor.ID)
+        return True
 
-    # Create and send a message
+    # Rebuild the neighbor indexes from the listing (after it was assigned directly)
+    def indexNeighbors(self):
+        listing = self.neighbors
+        for each in self.neighborIndex.values():
+            each.listedBy.pop(self.ID, None)
+
+        self.neighbors = []
+        self.neighborIndex = {}
+        for each in listing:
+            self.addNeighbor(each)
+
+    # Drop the whole neighbor listing and routing state when leaving the network
+    # (the departed node's own routes end with it and are not recorded one by one)
+    def detach(self):
+        for each in self.neighbors:
+            each.listedBy.pop(self.ID, None)
+
+        self.neighbors = []
+        self.neighborIndex = {}
+        self.receivedOGMs.clear()
+        self.held["receivedOGMs"] = memory.newHeld()
+        self.routesVia.clear()
+        self.changed("neighbors")
+        self.changed("topology")
+
+    # Remove every packet queued to a next hop from the send queue, returning them
+    def purgeQueued(self, nextHop):
+        purged = [each for each in self.sendQueue if each.nextHop == nextHop]
+        if len(purged) > 0:
+            self.sendQueue[:] = [each for each in self.sendQueue if each.nextHop != nextHop]
+            for each in purged:
+                memory.hold(self.held["sendQueue"], each, -1)
+            self.changed("send")
+
+        return purged
+
+    # Remove the OGMs transmitted by a node from the receive queue, returning them
+    # (a packet not delivered over a link counts as transmitted by its sender)
+    def purgeReceived(self, transmitter):
+        purged = []
+        kept = []
+        for packet in self.receiveQueue:
+            sentBy = packet.sender if packet.transmitter is None else packet.transmitter
+            if packet.payload == "" and sentBy == transmitter:
+                purged.append(packet)
+            else:
+                kept.append(packet)
+
+        if len(purged) > 0:
+            self.receiveQueue[:] = kept
+            for each in purged:
+                memory.hold(self.held["receiveQueue"], each, -1)
+            self.changed("receive")
+
+        return purged
+
+    # Start (or stop, with an empty IP) beaconing OGMs under another IP
+    def spoofAs(self, ip=""):
+        self.spoof = ip != ""
+        self.spoofIP = ip
+        self.spoofID = registry.intern(ip) if ip != "" else None
+
+    # Create and send a message to a destination IP, returning the queued packet (None if there is no route)
     def sendMessage(self, destination="", ttl=0, data=""):
-        if destination != "" and ttl > 0:
+        if destination != "" and registry.find(destination) is not None:
+            return self.sendMessageTo(registry.find(destination), ttl, data)
+
+        return None
+
+    # Create and send a message to a destination node ID
+    def sendMessageTo(self, destination, ttl=0, data=""):
+        if destination is not None and ttl > 0:
             found = False
             for index in self.neighbors:
-                if destination == index.IP:
+                if destination == index.ID:
                     found = True
 
             # Check if the destination is an immediate neighbor
             if found:
-                outgoing = ogm.OGM(origIP=self.IP, sendIP=self.IP, nextHop=destination, seq=200, ttl=ttl, destIP=destination, message=data)
-                self.sendQueue.append(outgoing)
-            else:
-                # Check the network topology for any received OGMs and send to the next hop neighbor
-                found = None
-                for key, value in self.receivedOGMs.iteritems():
-                    if key == destination:
-                        found = value
-
-                # The destination was found in known OGMs, so forward to the next hop sender
-                if found is not None:
-                    outgoing = ogm.OGM(origIP=self.IP, sendIP=self.IP, nextHop=found.senderIP, seq=200, ttl=ttl, destIP=destination, message=data)
-                    self.sendQueue.append(outgoing)
-
-    # Report current state to string
+                outgoing = ogm.OGM(origin=self.ID, sender=self.ID, nextHop=destination, seq=200, ttl=ttl, dest=destination, message=data, tick=self.clock)
+                self.enqueue(self.sendQueue, outgoing, "send")
+                return outgoing
+
+            # Check the network topology for any received OGMs and send to the next hop neighbor
+            # The destination was found in known OGMs, so forward to the next hop sender
+            if destination in self.receivedOGMs:
+                found = self.receivedOGMs[destination]
+                outgoing = ogm.OGM(origin=self.ID, sender=self.ID, nextHop=found.sender, seq=200, ttl=ttl, dest=destination, message=data, tick=self.clock)
+                self.enqueue(self.sendQueue, outgoing, "send")
+                return outgoing
+
+        return None
+
+    # Report current state to string, rendering again only the sections changed since the last report
     def reportString(self):
-        ip = "IP: " + str(self.IP) + "\n"
-        bct = "OGM Interval Time: " + str(self.broadcastTime) + "\n"
-        direction = "Uni-Directional Link: " + str(self.directional) + "\n"
-        seq = "Sequence: " + str(self.sequence) + "\n"
+        for section in REPORT_SECTIONS:
+            if section in self.dirty or section not in self.reportCache:
+                self.reportCache[section] = self.renderSection(section)
+
+        self.dirty.clear()
+        return "".join([self.reportCache[section] for section in REPORT_SECTIONS])
+
+    # Render one section of the report
+    def renderSection(self, section):
+        if section == "header":
+            ip = "IP: " + str(self.IP) + "\n"
+            bct = "OGM Interval Time: " + str(self.broadcastTime) + "\n"
+            direction = "Uni-Directional Link: " + str(self.directional) + "\n"
+            seq = "Sequence: " + str(self.sequence) + "\n"
+            return ip + bct + direction + seq
+
+        # Report queue limit drops by reason
+        if section == "drops":
+            drops = "Queue Drops (" + self.dropPolicy + "): "
+            for reason in sorted(self.drops):
+                drops += reason + "=" + str(self.drops[reason]) + " "
+            return drops + "\n"
 
         # Report IPs of neighbors
-        totNeighbors = "Neighbors: "
-        for neighbor in self.neighbors:
-            totNeighbors += str(neighbor.IP) + " "
-        totNeighbors += "\n"
+        if section == "neighbors":
+            totNeighbors = "Neighbors: "
+            for neighbor in self.neighbors:
+                totNeighbors += str(neighbor.IP) + " "
+            return totNeighbors + "\n"
 
         # Report Send queue
-        totSending = "Send Queue:\n"
-        for send in self.sendQueue:
-            totSending += "Sender: " + str(send.senderIP) + " Sequence: " + str(send.sequence) + "\n"
-        totSending += "\n"
+        if section == "send":
+            totSending = "Send Queue:\n"
+            for send in self.sendQueue:
+                totSending += "Sender: " + str(send.senderIP) + " Sequence: " + str(send.sequence) + "\n"
+            return totSending + "\n"
 
         # Report Receive Queue
-        totReceiving = "Received Queue:\n"
-        for receipt in self.receiveQueue:
-            totReceiving += "Sender: " + str(receipt.senderIP) + " Sequence: " + str(receipt.sequence) + "\n"
-        totReceiving += "\n"
+        if section == "receive":
+            totReceiving = "Received Queue:\n"
+            for receipt in self.receiveQueue:
+                totReceiving += "Sender: " + str(receipt.senderIP) + " Sequence: " + str(receipt.sequence) + "\n"
+            return totReceiving + "\n"
 
         # Check for messages received
-        totMessages = "Messages Received:\n"
-        for ip,message in self.receivedMessages.iteritems():
-            totMessages += "Sender: " + str(ip) + " Data:\n" + str(message.payload) + "\n"
-        totMessages += "\n"
+        if section == "messages":
+            totMessages = "Messages Received:\n"
+            for origin, message in self.receivedMessages.iteritems():
+                totMessages += "Sender: " + registry.ip(origin) + " Data:\n" + str(message.payload) + "\n"
+            return totMessages + "\n"
 
         # Repeat for OGMs
         totOGMs = "Network Topology: "
         for ogmIndex in self.receivedOGMs:
             totOGMs += str(self.receivedOGMs[ogmIndex].originatorIP) + " "
-        totOGMs += "\n\n"
-
-        return ip + bct + direction + seq + totNeighbors + totSending + totReceiving + totMessages + totOGMs
+        return totOGMs + "\n\n"
+
+    # Report only what changed since the previous delta report ("" when nothing did)
+    def reportDelta(self):
+        if len(self.deltaSections) == 0:
+            return ""
+
+        report = "IP: " + str(self.IP) + " Changes:\n"
+        if "header" in self.deltaSections:
+            report += "Sequence: " + str(self.sequence) + "\n"
+        if "drops" in self.deltaSections:
+            report += self.renderSection("drops")
+
+        if len(self.deltaNeighbors) > 0:
+            report += self.deltaString("Neighbors", self.deltaNeighbors)
+
+        if "send" in self.deltaSections:
+            report += "Send Queue: " + str(len(self.sendQueue)) + " packets\n"
+        if "receive" in self.deltaSections:
+            report += "Received Queue: " + str(len(self.receiveQueue)) + " packets\n"
+
+        if len(self.deltaMessages) > 0:
+            report += "New Messages Received:\n"
+            for origin, message in self.deltaMessages.iteritems():
+                report += "Sender: " + registry.ip(origin) + " Data:\n" + str(message.payload) + "\n"
+
+        if len(self.deltaRoutes) > 0:
+            report += self.deltaString("Network Topology", self.deltaRoutes)
+
+        self.deltaSections = set()
+        self.deltaNeighbors = {}
+        self.deltaRoutes = {}
+        self.deltaMessages = {}
+        return report + "\n"
+
+    # List the IPs added and removed in a delta table
+    def deltaString(self, title, table):
+        added = [registry.ip(key) for key, value in table.iteritems() if value]
+        removed = [registry.ip(key) for key, value in table.iteritems() if not value]
+
+        report = ""
+        if len(added) > 0:
+            report += title + " Added: " + " ".join(added) + "\n"
+        if len(removed) > 0:
+            report += title + " Removed: " + " ".join(removed) + "\n"
+
+        return report
 
     # The sequel of the hit action film: reportString()
     def reportFile(self):
@@ -237,7 +627,7 @@ class User:
         # Repeat for OGMs
         totOGMs = "Received OGMs: "
         for ogmIndex in self.receivedOGMs.keys():
-            totOGMs += str(ogmIndex) + " "
+            totOGMs += registry.ip(ogmIndex) + " "
         totOGMs += "\n"
         fileOUT.write(totOGMs)
 
@@ -249,8 +639,8 @@ class User:
         for each in self.sendQueue:
             removal = False
             # Check for lower-value sequences and mark for removal if found
-            if each.originatorIP in self.receivedOGMs.keys():
-                if each.sequence < self.receivedOGMs[each.originatorIP].sequence:
+            if each.originator in self.receivedOGMs:
+                if each.sequence < self.receivedOGMs[each.originator].sequence:
                     removal = True
 
             # Check for exceeded TTL and mark for removal if 0 or lower
@@ -260,11 +650,13 @@ class User:
 
             if removal:
                 self.sendQueue.remove(each)
+                memory.hold(self.held["sendQueue"], each, -1)
+                self.changed("send")
 
         for each in self.receiveQueue:
             removal = False
-            if each.originatorIP in self.receivedOGMs.keys():
-                if each.sequence < self.receivedOGMs[each.originatorIP].sequence:
+            if each.originator in self.receivedOGMs:
+                if each.sequence < self.receivedOGMs[each.originator].sequence:
                     removal = True
 
             each.TTL -= deltaTime
@@ -273,19 +665,18 @@ class User:
 
             if removal:
                 self.receiveQueue.remove(each)
+                memory.hold(self.held["receiveQueue"], each, -1)
+                self.changed("receive")
 
-        ipKeys = []
+        idKeys = []
         for key, value in self.receivedOGMs.iteritems():
             value.TTL -= deltaTime
             if value.TTL <= 0:
-                ip = value.originatorIP
-
-                for neighbor in self.neighbors:
-                    if neighbor.IP == ip:
-                        self.neighbors.remove(neighbor)
-
-                ipKeys.append(ip)
-
-        if len(ipKeys) > 0:
-            for each in ipKeys:
-                self.receivedOGMs.pop(each)
+                idKeys.append(value.originator)
+
+        # A neighbor whose own OGMs expired is lost along with the routes through it
+        if len(idKeys) > 0:
+            for each in idKeys:
+                self.dropRoute(each)
+                if each in self.neighborIndex:
+                    self.removeNeighbor(self.neighborIndex[each])
@@ -0,0 +1,93 @@
+################################################################################
+# warmstart.py                                                                 #
+# Analytic warm start for the BATMAN Simulator. Instead of flooding OGMs for   #
+# hundreds of time steps, the converged routing state is computed directly     #
+# from the static topology: a breadth-first search over the neighbor listings  #
+# from every originator gives each node the hop that first delivers that       #
+# originator's OGMs, along with the trace route and remaining TTL. Sequence    #
+# counters are set as if every node had broadcast the given number of rounds.  #
+################################################################################
+
+import collections
+
+import ogm
+
+
+# Fill every node's routing knowledge as if the network had run to steady state
+def warmStart(controller, rounds=1):
+    network = controller.network
+
+    # Start from empty queues and links, with the sequence counters advanced
+    for key, value in network.iteritems():
+        value.clearQueue("send")
+        value.clearQueue("receive")
+        value.clock = controller.clock
+        for origin in list(value.receivedOGMs):
+            value.dropRoute(origin)
+        if value.sequence < max(rounds, 1):
+            value.sequence = max(rounds, 1)
+            value.changed("header")
+        value.timeToCast = 0
+
+    controller.links = {}
+    controller.nodeLinks = {}
+    controller.activeLinks = set()
+
+    # Nodes hearing an originator directly take it on as a neighbor before anything is forwarded
+    for key, value in network.iteritems():
+        origin = value.spoofID if value.spoof else value.ID
+        if value.directional or origin not in network:
+            continue
+
+        for neighbor in list(value.neighbors):
+            if neighbor.ID != origin:
+                neighbor.addNeighbor(network[origin])
+
+    # In sampled mode only the tracked originators are spread
+    for key, value in network.iteritems():
+        origin = value.spoofID if value.spoof else value.ID
+        if not value.directional and (controller.tracked is None or origin in controller.tracked):
+            spreadOGM(network, value)
+
+    return controller
+
+
+# Breadth-first flood of one originator's latest OGM over the neighbor listings
+def spreadOGM(network, originator):
+    origin = originator.spoofID if originator.spoof else originator.ID
+    sequence = originator.sequence - 1
+
+    # Trace routes convention: <key>node ID : <value> list of node IDs from the originator
+    routes = {originator.ID: [origin]}
+    frontier = collections.deque([originator])
+
+    while len(frontier) > 0:
+        current = frontier.popleft()
+        trace = routes[current.ID]
+
+        # OGMs are dropped once the TTL runs out and never forwarded by uni-directional nodes
+        if len(trace) > originator.keepAlive:
+            continue
+        if current is not originator and current.directional:
+            continue
+
+        for neighbor in current.neighbors:
+            if neighbor.ID in routes or neighbor.ID == origin:
+                continue
+
+            route = trace + [neighbor.ID]
+            routes[neighbor.ID] = route
+            frontier.append(neighbor)
+
+            # A spoofed originator competes with the real one: the newer sequence (then the shorter route) wins
+            known = neighbor.receivedOGMs.get(origin)
+            if known is not None:
+                if known.sequence > sequence:
+                    continue
+                if known.sequence == sequence and len(known.traceroute) <= len(route):
+                    continue
+
+            received = ogm.OGM(origin=origin, sender=route[-2], nextHop=neighbor.ID, seq=sequence,
+                               ttl=originator.keepAlive - (len(route) - 1), direction=False)
+            received.traceroute = route
+            neighbor.setRoute(origin, received)
@@ -0,0 +1,346 @@
+################################################################################
+# wire.py                                                                      #
+# Binary wire format of the BATMAN Simulator. Each OGM or message is encoded   #
+# as a fixed 52-byte header followed by its trace route (one IPv4 address per  #
+# hop) and its data payload, packed straight into bytearray or memoryview      #
+# buffers with struct. Node names that are not dotted quads go as their node   #
+# ID, marked by flag bits, so every IPv4 address stays a real address.         #
+# Aggregated frames are their OGMs back to back. The pcap writer streams the   #
+# packets of a run as IPv4/UDP datagrams so that large simulations can be      #
+# read by standard packet analysis tools.                                      #
+################################################################################
+
+import socket
+import struct
+import weakref
+
+import ogm
+import registry
+
+
+# Header layout: version, flags, trace route length, TTL, sequence, originator, sender, next hop,
+# destination, injected time step, queued time step, payload length, and 12 reserved bytes
+HEADER = struct.Struct("!BBHiI4s4s4s4sIII12x")
+VERSION = 2
+
+# Header flags, with a flag per address field written as a node ID
+# With FLAG_TRACE_IDS the trace route is followed by a bitmap of its hops written as node IDs
+FLAG_DIRECTIONAL = 0x01
+FLAG_DESTINATION = 0x02
+FLAG_NEXTHOP = 0x04
+FLAG_ORIGINATOR_ID = 0x08
+FLAG_SENDER_ID = 0x10
+FLAG_NEXTHOP_ID = 0x20
+FLAG_DESTINATION_ID = 0x40
+FLAG_TRACE_IDS = 0x80
+HOP = struct.Struct("!I")
+
+# Encoded addresses convention: <key>registry : <value> <key>node ID : <value> (4 address bytes, True when
+# written as the node ID), so each registry's IDs are cached apart and go with it
+addresses = weakref.WeakKeyDictionary()
+
+# pcap file and record headers, raw IPv4 link type, and the IPv4 and UDP headers of each datagram
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+PCAP_MAGIC = 0xA1B2C3D4
+LINKTYPE_RAW = 101
+IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+UDP_HEADER = struct.Struct("!HHHH")
+BATMAN_PORT = 4305
+
+# Type of service bits of a datagram marking its source or destination address as a node ID
+TOS_SOURCE_ID = 0x04
+TOS_DESTINATION_ID = 0x08
+
+# Largest UDP payload one IPv4 datagram can carry
+MAX_DATAGRAM = 65507
+
+
+# Encode a node ID as (4 address bytes, True when the name is not a dotted quad and the ID is written instead)
+def packAddress(nodeID):
+    if nodeID is None:
+        return "\x00\x00\x00\x00", False
+
+    cache = addresses.get(registry.nodes)
+    if cache is None:
+        cache = addresses[registry.nodes] = {}
+
+    found = cache.get(nodeID)
+    if found is None:
+        ip = registry.ip(nodeID)
+        try:
+            found = socket.inet_aton(ip), False
+            if socket.inet_ntoa(found[0]) != ip:
+                found = HOP.pack(nodeID), True
+        except socket.error:
+            found = HOP.pack(nodeID), True
+        cache[nodeID] = found
+
+    return found
+
+
+# Decode 4 address bytes to a node ID
+def unpackAddress(address, isID=False):
+    if isID:
+        return HOP.unpack(address)[0]
+
+    return registry.intern(socket.inet_ntoa(address))
+
+
+# Bitmap of the trace route hops written as node IDs ("" when every hop is a dotted quad)
+def traceBitmap(packet):
+    bits = 0
+    for index, hop in enumerate(packet.traceroute):
+        if packAddress(hop)[1]:
+            bits |= 1 << index
+
+    if bits == 0:
+        return ""
+
+    return "".join([chr((bits >> shift) & 0xFF) for shift in range(0, len(packet.traceroute), 8)])
+
+
+# Payloads are byte strings on the wire
+def payloadBytes(packet):
+    payload = packet.payload
+    if isinstance(payload, unicode):
+        payload = payload.encode("utf-8")
+
+    return payload
+
+
+# Number of bytes a packet (OGM, message, or frame) takes on the wire
+def encodedSize(packet):
+    if isinstance(packet, ogm.Frame):
+        return sum([encodedSize(each) for each in packet.packets])
+
+    return HEADER.size + HOP.size * len(packet.traceroute) + len(traceBitmap(packet)) + len(payloadBytes(packet))
+
+
+# Split a packet into the lists of packets sent as datagrams of at most limit bytes
+# Frames are split between whole OGMs, a single packet larger than the limit still goes alone
+def datagrams(packet, limit=MAX_DATAGRAM):
+    if not isinstance(packet, ogm.Frame) or encodedSize(packet) <= limit:
+        return [[packet]]
+
+    batches = []
+    batch = []
+    size = 0
+    for each in packet.packets:
+        eachSize = encodedSize(each)
+        if size + eachSize > limit and len(batch) > 0:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(each)
+        size += eachSize
+    batches.append(batch)
+
+    return batches
+
+
+# Pack a packet into a buffer at an offset, returning the offset just past it
+def packInto(buffer, offset, packet):
+    if isinstance(packet, ogm.Frame):
+        for each in packet.packets:
+            offset = packInto(buffer, offset, each)
+        return offset
+
+    payload = payloadBytes(packet)
+    bitmap = traceBitmap(packet)
+    originator, originatorID = packAddress(packet.originator)
+    sender, senderID = packAddress(packet.sender)
+    nextHop, nextHopID = packAddress(packet.nextHop)
+    destination, destinationID = packAddress(packet.destination)
+
+    flags = 0
+    if packet.directional:
+        flags |= FLAG_DIRECTIONAL
+    if packet.destination is not None:
+        flags |= FLAG_DESTINATION
+    if packet.nextHop is not None:
+        flags |= FLAG_NEXTHOP
+    if originatorID:
+        flags |= FLAG_ORIGINATOR_ID
+    if senderID:
+        flags |= FLAG_SENDER_ID
+    if nextHopID:
+        flags |= FLAG_NEXTHOP_ID
+    if destinationID:
+        flags |= FLAG_DESTINATION_ID
+    if bitmap:
+        flags |= FLAG_TRACE_IDS
+
+    HEADER.pack_into(buffer, offset, VERSION, flags, len(packet.traceroute), packet.TTL, packet.sequence,
+                     originator, sender, nextHop, destination, packet.injectTick, packet.queuedAt, len(payload))
+    offset += HEADER.size
+
+    for hop in packet.traceroute:
+        buffer[offset:offset + HOP.size] = packAddress(hop)[0]
+        offset += HOP.size
+
+    buffer[offset:offset + len(bitmap)] = bitmap
+    offset += len(bitmap)
+
+    buffer[offset:offset + len(payload)] = payload
+    return offset + len(payload)
+
+
+# Encode a packet into a new buffer
+def encode(packet):
+    buffer = bytearray(encodedSize(packet))
+    packInto(buffer, 0, packet)
+    return buffer
+
+
+# Unpack one OGM or message from a buffer at an offset, returning it and the offset just past it
+def unpackFrom(buffer, offset=0):
+    (version, flags, traceLength, ttl, sequence, originator, sender, nextHop, destination, injectTick, queuedAt,
+     payloadLength) = HEADER.unpack_from(buffer, offset)
+    offset += HEADER.size
+
+    if version != VERSION:
+        raise ValueError("Unknown OGM wire format version " + str(version))
+
+    packet = ogm.OGM(origin=unpackAddress(originator, flags & FLAG_ORIGINATOR_ID),
+                     sender=unpackAddress(sender, flags & FLAG_SENDER_ID), seq=sequence, ttl=ttl,
+                     direction=bool(flags & FLAG_DIRECTIONAL), tick=injectTick)
+    if flags & FLAG_NEXTHOP:
+        packet.nextHop = unpackAddress(nextHop, flags & FLAG_NEXTHOP_ID)
+    if flags & FLAG_DESTINATION:
+        packet.destination = unpackAddress(destination, flags & FLAG_DESTINATION_ID)
+    packet.queuedAt = queuedAt
+
+    view = memoryview(buffer)
+    bits = 0
+    if flags & FLAG_TRACE_IDS:
+        bitmap = view[offset + HOP.size * traceLength:offset + HOP.size * traceLength + (traceLength + 7) // 8]
+        for index, byte in enumerate(bitmap.tobytes()):
+            bits |= ord(byte) << (8 * index)
+
+    packet.traceroute = []
+    for index in range(0, traceLength):
+        packet.traceroute.append(unpackAddress(view[offset:offset + HOP.size].tobytes(), bits & (1 << index)))
+        offset += HOP.size
+
+    if flags & FLAG_TRACE_IDS:
+        offset += (traceLength + 7) // 8
+
+    packet.payload = view[offset:offset + payloadLength].tobytes()
+    return packet, offset + payloadLength
+
+
+# Decode every packet in a buffer (more than one for an aggregated frame)
+def decode(buffer):
+    packets = []
+    offset = 0
+    while offset < len(buffer):
+        packet, offset = unpackFrom(buffer, offset)
+        packets.append(packet)
+
+    return packets
+
+
+# Internet checksum of a header
+def checksum(header):
+    total = 0
+    for index in range(0, len(header) - 1, 2):
+        total += (header[index] << 8) + header[index + 1]
+
+    while total > 0xFFFF:
+        total = (total & 0xFFFF) + (total >> 16)
+
+    return ~total & 0xFFFF
+
+
+class PcapWriter:
+    # Constructor - every simulated time step lasts tickSeconds of capture time
+    def __init__(self, fileName, tickSeconds=0.1, snapLength=65535):
+        self.fileName = fileName
+        self.tickSeconds = tickSeconds
+        self.snapLength = snapLength
+        self.fileOUT = open(fileName, "wb")
+        self.fileOUT.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, snapLength, LINKTYPE_RAW))
+
+        # One buffer is reused for every datagram, grown when a larger packet arrives
+        self.buffer = bytearray(4096)
+        self.headerSize = IPV4_HEADER.size + UDP_HEADER.size
+
+        self.packets = 0
+        self.identification = 0
+
+    # Write one packet crossing from a node to its next hop as IPv4/UDP datagrams
+    # A frame too large for one datagram is written as several records of whole OGMs
+    def write(self, clock, source, nextHop, packet):
+        for batch in datagrams(packet):
+            self.writeDatagram(clock, source, nextHop, batch)
+
+    # Write packets as one IPv4/UDP datagram record
+    # The length fields of a lone packet too large for any datagram are capped at their maximum
+    def writeDatagram(self, clock, source, nextHop, packets):
+        size = self.headerSize + sum([encodedSize(each) for each in packets])
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+
+        end = self.headerSize
+        for each in packets:
+            end = packInto(self.buffer, end, each)
+        self.identification = (self.identification + 1) & 0xFFFF
+
+        sourceAddress, sourceID = packAddress(source)
+        nextHopAddress, nextHopID = packAddress(nextHop)
+        tos = (TOS_SOURCE_ID if sourceID else 0) | (TOS_DESTINATION_ID if nextHopID else 0)
+
+        IPV4_HEADER.pack_into(self.buffer, 0, 0x45, tos, min(size, 0xFFFF), self.identification, 0, 64,
+                              socket.IPPROTO_UDP, 0, sourceAddress, nextHopAddress)
+        struct.pack_into("!H", self.buffer, 10, checksum(self.buffer[:IPV4_HEADER.size]))
+        UDP_HEADER.pack_into(self.buffer, IPV4_HEADER.size, BATMAN_PORT, BATMAN_PORT,
+                             min(size - IPV4_HEADER.size, 0xFFFF), 0)
+
+        captured = min(end, self.snapLength)
+        stamp = clock * self.tickSeconds
+        seconds = int(stamp)
+        self.fileOUT.write(PCAP_RECORD.pack(seconds, int(round((stamp - seconds) * 1000000)), captured, end))
+        self.fileOUT.write(memoryview(self.buffer)[:captured])
+        self.packets += 1
+
+    # Controller listener: write the hops of the step just run
+    def update(self, clock, hops):
+        for source, nextHop, packet in hops:
+            self.write(clock, source, nextHop, packet)
+
+    # Flush and close the capture file
+    def close(self):
+        if not self.fileOUT.closed:
+            self.fileOUT.close()
+
+
+# Read a capture written by PcapWriter as (time step, source ID, next hop ID, packets) tuples
+def readPcap(fileName, tickSeconds=0.1):
+    fileIN = open(fileName, "rb")
+    header = fileIN.read(PCAP_HEADER.size)
+    if len(header) < PCAP_HEADER.size or PCAP_HEADER.unpack(header)[0] != PCAP_MAGIC:
+        fileIN.close()
+        raise ValueError("Not a pcap capture: " + str(fileName))
+
+    headerSize = IPV4_HEADER.size + UDP_HEADER.size
+    try:
+        while True:
+            record = fileIN.read(PCAP_RECORD.size)
+            if len(record) < PCAP_RECORD.size:
+                break
+
+            seconds, micros, captured, length = PCAP_RECORD.unpack(record)
+            datagram = bytearray(fileIN.read(captured))
+            fields = IPV4_HEADER.unpack_from(datagram, 0)
+
+            # A record cut short by the snap length holds no whole packets to decode
+            packets = []
+            if captured == length:
+                packets = decode(memoryview(datagram)[headerSize:])
+
+            clock = int(round((seconds + micros / 1000000.0) / tickSeconds))
+            yield clock, unpackAddress(fields[8], fields[1] & TOS_SOURCE_ID), \
+                unpackAddress(fields[9], fields[1] & TOS_DESTINATION_ID), packets
+    finally:
+        fileIN.close()